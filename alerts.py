@@ -0,0 +1,195 @@
+import os
+import json
+import operator
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Optional, Any, Callable, Hashable, Tuple, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking of the outbox where fcntl is unavailable (Windows)
+    fcntl = None
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+             '==': operator.eq, '!=': operator.ne}
+
+# The dashboard's red signals. Each condition is [fact, operator, threshold] and all of them have to hold.
+# Every numeric fact also has a `<fact>_change`, measured from the rule's baseline for the entity (see AlertEngine).
+DEFAULT_RULES = [
+    {'name': 'milestone_timeline_nearly_elapsed', 'entity': 'milestone',
+     'conditions': [['elapsed_percent', '>=', 85], ['completion_percent', '<', 100]],
+     'message': '{name} is {elapsed_percent:.0f}% through its timeline at {completion_percent:.0f}% complete'},
+    {'name': 'milestone_past_sandbox_date', 'entity': 'milestone',
+     'conditions': [['days_to_sandbox', '<', 0], ['completion_percent', '<', 95]],
+     'message': '{name} is {days_past_sandbox} days past its sandbox date at {completion_percent:.0f}% complete'},
+    {'name': 'sprint_triage_growing', 'entity': 'sprint',
+     'conditions': [['triage_count_change', '>', 0]],
+     'message': '{name}: {triage_count} stories in triage, up {triage_count_change}'},
+]
+
+
+class FileOutbox:
+    """
+    Alert events appended as JSON lines, for a notifier (Slack, email, a webhook relay) to pick up. The
+    dashboard and report.py may share one outbox: writers hold it exclusively, and each catches up on
+    what the others appended before adding its own events.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        # Bytes of the file this outbox has already read
+        self._offset = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Hold the outbox exclusively, across processes where fcntl is available.
+        :return: (events appended since this outbox's last transaction, a list to add events to, which are
+            appended when the transaction ends)
+        """
+        with self._lock, open(self._path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_size < self._offset:
+                    # Truncated or rotated
+                    self._offset = 0
+                f.seek(self._offset)
+                written = [json.loads(line) for line in f.read().decode().splitlines() if line.strip()]
+                events: List[Dict[str, Any]] = []
+                yield written, events
+                for event in events:
+                    f.write((json.dumps(event) + '\n').encode())
+                f.flush()
+                self._offset = f.tell()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_alert_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Rules from the JSON file named by SPRINT_DB_ALERT_RULES, in the shape of DEFAULT_RULES.
+    """
+    path = path or os.getenv('SPRINT_DB_ALERT_RULES')
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_outbox() -> FileOutbox:
+    return FileOutbox(os.getenv('SPRINT_DB_ALERT_OUTBOX', 'sprint_alerts.jsonl'))
+
+
+class AlertEngine:
+    """
+    Evaluates health rules per entity (a milestone, a sprint) as data syncs. An entity's facts are only
+    computed and evaluated when its version changed since its last evaluation.
+
+    `<fact>_change` facts are measured from a baseline per rule and entity: the entity's facts when the
+    rule last resolved, or when the rule was first evaluated for it. The baseline stays put while the rule
+    fires, so an unrelated edit or a restart does not resolve it. An alert is written to the outbox once
+    when it starts firing and once when it resolves; baselines are written as `baseline` events. Firing
+    alerts and baselines are read back from the outbox, on start and before every evaluation, so a restart
+    or another process sharing the outbox does not repeat them.
+    """
+
+    def __init__(self, tenant: str, rules: Optional[List[Dict[str, Any]]] = None,
+                 outbox: Optional[FileOutbox] = None):
+        self.tenant = tenant
+        self.rules = rules if rules is not None else load_alert_rules()
+        self.outbox = outbox or get_outbox()
+        # (entity, id) -> version of its last evaluation
+        self._versions: Dict[Tuple[str, Hashable], Hashable] = {}
+        # (rule, entity, id) -> firing event / numeric facts its changes are measured from
+        self._firing: Dict[Tuple[str, str, Hashable], Dict[str, Any]] = {}
+        self._baselines: Dict[Tuple[str, str, Hashable], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        with self._lock, self.outbox.transaction() as (written, _):
+            self._apply(written)
+
+    def _apply(self, events: List[Dict[str, Any]]):
+        for event in events:
+            if event['tenant'] != self.tenant:
+                continue
+            key = (event['rule'], event['entity'], event['entity_id'])
+            if event['status'] == 'firing':
+                self._firing[key] = event
+                self._baselines[key] = event['baseline']
+            elif event['status'] == 'resolved':
+                self._firing.pop(key, None)
+                self._baselines[key] = event['facts']
+            elif key not in self._baselines:
+                self._baselines[key] = event['facts']
+
+    @staticmethod
+    def _uses_changes(rule: Dict[str, Any]) -> bool:
+        return any(fact.endswith('_change') for fact, _, _ in rule['conditions'])
+
+    @staticmethod
+    def _matches(rule: Dict[str, Any], facts: Dict[str, Any]) -> bool:
+        for fact, op, threshold in rule['conditions']:
+            value = facts.get(fact)
+            if value is None or not OPERATORS[op](value, threshold):
+                return False
+        return True
+
+    def _event(self, rule: Dict[str, Any], entity: str, entity_id: Hashable, status: str, message: str,
+               **fields) -> Dict[str, Any]:
+        return {'tenant': self.tenant, 'rule': rule['name'], 'entity': entity, 'entity_id': entity_id,
+                'status': status, 'message': message, 'at': datetime.now().isoformat(timespec='seconds'),
+                **fields}
+
+    def sync(self, entity: str, entity_id: Hashable, version: Hashable,
+             compute_facts: Callable[[], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        :param entity: entity type the rules are written for, e.g. 'milestone' or 'sprint'
+        :param version: changes whenever the entity's data does, e.g. a hash of its stories' updated_at
+        :param compute_facts: the entity's facts, including its `name`. Only called when version changed
+        :return: the firing and resolved events written to the outbox
+        """
+        key = (entity, entity_id)
+        with self._lock:
+            if self._versions.get(key) == version:
+                return []
+            facts = compute_facts()
+            self._versions[key] = version
+            numeric = {fact: value for fact, value in facts.items()
+                       if isinstance(value, (int, float)) and not isinstance(value, bool)}
+            name = facts.get('name', entity_id)
+
+            with self.outbox.transaction() as (written, events):
+                self._apply(written)
+                for rule in self.rules:
+                    if rule['entity'] != entity:
+                        continue
+                    alert_key = (rule['name'], entity, entity_id)
+                    baseline = self._baselines.get(alert_key)
+                    if baseline is None and self._uses_changes(rule):
+                        baseline = self._baselines[alert_key] = numeric
+                        events.append(self._event(rule, entity, entity_id, 'baseline', f"Baseline: {name}",
+                                                  facts=numeric))
+                    rule_facts = dict(facts)
+                    for fact, value in numeric.items():
+                        rule_facts[fact + '_change'] = value - (baseline or {}).get(fact, value)
+
+                    firing = self._matches(rule, rule_facts)
+                    if firing and alert_key not in self._firing:
+                        event = self._event(rule, entity, entity_id, 'firing', rule['message'].format(**rule_facts),
+                                            baseline=baseline, facts=numeric)
+                        self._firing[alert_key] = event
+                        events.append(event)
+                    elif not firing and alert_key in self._firing:
+                        del self._firing[alert_key]
+                        self._baselines[alert_key] = numeric
+                        events.append(self._event(rule, entity, entity_id, 'resolved', f"Resolved: {name}",
+                                                  facts=numeric))
+            return [e for e in events if e['status'] != 'baseline']
+
+    def get_firing(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._firing.values())
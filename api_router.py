@@ -1,9 +1,31 @@
-import os
 import sys
+import json
+import time
+import bisect
+import threading
 import requests
 import streamlit as st
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from datetime import datetime, date
+from typing import List, Dict, Optional, Any, Tuple, MutableMapping, Callable
+from change_log import ChangeLog
+from shared_cache import SharedCache
+from tenants import TenantConfig
+
+# Workflow state classes, as bit flags per workflow state ID. The first three come from Shortcut's
+# state `type`, the rest from the tenant's configured state groups.
+STATE_UNSTARTED = 1
+STATE_STARTED = 1 << 1
+STATE_DONE = 1 << 2
+STATE_REVIEW = 1 << 3
+STATE_TRIAGE = 1 << 4
+STATE_UNNEEDED = 1 << 5
+STATE_READY = 1 << 6
+STATE_TYPE_FLAGS = {'unstarted': STATE_UNSTARTED, 'started': STATE_STARTED, 'done': STATE_DONE}
+STATE_GROUP_FLAGS = {'review': STATE_REVIEW, 'triage': STATE_TRIAGE, 'unneeded': STATE_UNNEEDED, 'ready': STATE_READY}
 
 # Distribution of stories per Milestone within the Sprint
 # Distribution of stories per person
@@ -14,9 +36,46 @@ from typing import List, Dict, Optional, Any
 #   - % of in progress stories - grouped by milestone within the Sprint
 
 
-class ApiRouter:
+class _InFlightCall:
+    """
+    An upstream request being made by one thread, that other threads asking for the same URL wait on.
+    """
+
     def __init__(self):
+        self.done = threading.Event()
+        self.body: Any = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.body
+
+
+class ApiRouter:
+    def __init__(self, tenant: Optional[TenantConfig] = None, url_cache: Optional[MutableMapping] = None,
+                 shared_cache: Optional[SharedCache] = None):
+        self.tenant = tenant or TenantConfig()
+        # Parsed responses by URL. Per viewer session by default; headless callers pass their own mapping
+        self._url_cache = url_cache if url_cache is not None else st.session_state
+        # Optional cache tier shared with the other replicas, checked before going upstream
+        self._shared_cache = shared_cache
+        self._shared_cache_lease_seconds = 30
         self._calls_made = 0
+        # Timestamps of the calls made in the last minute, to stay within the tenant's rate-limit budget
+        self._recent_calls = deque()
+        self._rate_limit_lock = threading.Lock()
+        # One router serves every viewer of a tenant from concurrent script threads: _lock guards the
+        # lazily filled maps and counters below, _in_flight holds the upstream requests being made
+        # right now by cache key, so concurrent misses for the same URL share one request
+        self._lock = threading.RLock()
+        self._in_flight: Dict[str, _InFlightCall] = dict()
+        # Bumped whenever the loaded Shortcut data is dropped for a reload, and part of every session URL
+        # cache key
+        self._generation = 0
+        self._loaded_at = time.monotonic()
+        self.change_log = ChangeLog(retention_seconds=self.tenant.change_retention_days * 24 * 3600)
         # _retry_strategy = Retry(
         #     total=3,
         #     status_forcelist=[429, 500, 502, 503, 504],
@@ -24,37 +83,61 @@ class ApiRouter:
         #     backoff_factor=1
         # )
         self.session = requests.Session()
+        # pool_block: threads beyond pool_maxsize wait for a free connection rather than opening (and then
+        # discarding) extra ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.tenant.pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        # url -> validators (ETag / Last-Modified) and the parsed body they validate, shared across sessions
+        self._validators: Dict[str, Dict[str, Any]] = dict()
+        self._not_modified = 0
+        self._bytes_received = 0
+        self._bytes_saved = 0
         # self.session.mount("https://", HTTPAdapter(max_retries=_retry_strategy))
 
-        self._base_url = 'https://api.app.shortcut.com/api'
-        _token = os.getenv('SHORTCUT_API_TOKEN')
-        self._shortcut_token = '?token=' + _token
+        self._base_url = self.tenant.base_url
+        self._shortcut_token = 'token=' + self.tenant.token
         self._get_milestones_url = '/v3/milestones'
         self._get_epics_url = '/v3/epics'
         self._get_stories_url = '/v3/stories'
+        self._search_stories_url = '/v3/stories/search'
+        # Epic IDs per bulk story search request
+        self._search_epics_per_request = 50
         self._get_iteration_url = '/v3/iterations'
         self._get_members_url = '/v3/members'
         self._get_workflows_url = '/v3/workflows'
         self._get_iteration_with_id_url = '/v3/iterations/{}'
 
-        # 3073: No Projects Assigned, 3077: General Bugs & Improvements
-        self._special_milestone_ids = {3073, 3077}
+        self._special_milestone_ids = self.tenant.special_milestone_ids
         self._all_milestones = dict()
         self._special_milestones = dict()
+        # (completion date, milestone id), sorted by date
+        self._milestones_by_completion: List[Tuple[date, int]] = list()
         self._all_sprints = list()
         self._milestone_epic_mappings = dict()
         self._epic_story_mappings = dict()
         self._members_dict = self._create_members_map()
-        self._workflows_dict = self._create_workflows_id_map()
+        self._workflows_dict, self._state_classes = self._create_workflows_id_map()
         self._iteration_map = dict()
 
-    def _create_workflows_id_map(self) -> Dict[int, str]:
+    def _create_workflows_id_map(self) -> Tuple[Dict[int, str], Dict[int, int]]:
+        """
+        :return: workflow state id -> state name, and workflow state id -> STATE_* flags
+        """
         workflows_dict: Dict[int, str] = {}
+        state_classes: Dict[int, int] = {}
         workflows = self.make_api_call(f"{self._base_url}{self._get_workflows_url}")
+        group_flags_by_name: Dict[str, int] = {}
+        for group, state_names in self.tenant.state_groups.items():
+            for state_name in state_names:
+                group_flags_by_name[state_name] = group_flags_by_name.get(state_name, 0) | STATE_GROUP_FLAGS[group]
         for workflow in workflows:
             for state in workflow['states']:
                 workflows_dict[state['id']] = state['name']
-        return workflows_dict
+                state_classes[state['id']] = (STATE_TYPE_FLAGS.get(state.get('type'), 0) |
+                                              group_flags_by_name.get(state['name'], 0))
+        return workflows_dict, state_classes
 
     def _create_members_map(self):
         members = self.make_api_call(self._base_url + self._get_members_url)
@@ -65,19 +148,177 @@ class ApiRouter:
         }
         return members_dict
 
-    def make_api_call(self, url):
-        if url in st.session_state:
-            return st.session_state[url]
+    def _wait_for_rate_limit(self):
+        # Held while sleeping, so that waiting threads take the freed slots in turn
+        with self._rate_limit_lock:
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] >= 60:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self.tenant.requests_per_minute:
+                time.sleep(60 - (now - self._recent_calls[0]))
+                self._recent_calls.popleft()
+            self._recent_calls.append(time.monotonic())
+
+    def make_api_call(self, url, payload: Optional[Dict[str, Any]] = None):
+        """
+        GET `url`, or POST `payload` to it as JSON when given (used by the search endpoints).
+        """
+        request_key = url if payload is None else url + ":" + json.dumps(payload, sort_keys=True)
+        # Session state is shared by every tenant a viewer opens, so key it by tenant as well
+        self._drop_stale_url_cache_entries()
+        cache_key = f"{self.tenant.name}:{self._generation}:{request_key}"
+        if cache_key in self._url_cache:
+            return self._url_cache[cache_key]
+        if self._shared_cache is not None:
+            # Not keyed by generation, which counts this process' refreshes: replicas would never agree on it.
+            # The shared cache's TTL keeps its entries as fresh as a refresh would
+            shared_key = f"{self.tenant.name}:{request_key}"
+            body = self._single_flight(cache_key, lambda: self._fetch_through_shared_cache(shared_key, url, payload))
+        else:
+            body = self._single_flight(cache_key, lambda: self._fetch(url, payload))
+        # Add this URL to session state
+        self._url_cache[cache_key] = body
+        return body
+
+    def _drop_stale_url_cache_entries(self):
+        # Once per URL cache and generation: responses from before the last refresh are never read again
+        marker = f"{self.tenant.name}:generation"
+        generation = self._generation
+        if self._url_cache.get(marker) == generation:
+            return
+        prefix, current = f"{self.tenant.name}:", f"{self.tenant.name}:{generation}:"
+        for key in [k for k in list(self._url_cache.keys())
+                    if isinstance(k, str) and k.startswith(prefix) and not k.startswith(current) and k != marker]:
+            del self._url_cache[key]
+        self._url_cache[marker] = generation
+
+    @property
+    def generation(self) -> int:
+        # Bumped by every refresh_if_stale that dropped the loaded data
+        return self._generation
+
+    def refresh_if_stale(self) -> bool:
+        """
+        Drop the loaded milestones, epics, stories and iterations once they are older than the tenant's
+        refresh_seconds, so that the next lookups reload them. Workflows and members are reloaded right away,
+        as stories are looked up in them: a new member or workflow state would otherwise stay unknown.
+        :return: whether the data was dropped
+        """
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.tenant.refresh_seconds:
+                return False
+            self._generation += 1
+            self._loaded_at = time.monotonic()
+            self._all_milestones = dict()
+            self._special_milestones = dict()
+            self._milestones_by_completion = list()
+            self._all_sprints = list()
+            self._iteration_map = dict()
+            self._milestone_epic_mappings = dict()
+            self._epic_story_mappings = dict()
+        # Fetched outside of the lock, other threads keep the current maps until then
+        members_dict = self._create_members_map()
+        workflows_dict, state_classes = self._create_workflows_id_map()
+        with self._lock:
+            self._members_dict = members_dict
+            self._workflows_dict, self._state_classes = workflows_dict, state_classes
+        return True
+
+    def _single_flight(self, cache_key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Run fetch, unless another thread is already fetching cache_key: then wait for and share its result.
+        """
+        with self._lock:
+            call = self._in_flight.get(cache_key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[cache_key] = _InFlightCall()
+        if not leader:
+            return call.wait()
+        try:
+            call.body = fetch()
+            return call.body
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[cache_key]
+            call.done.set()
+
+    def _fetch_through_shared_cache(self, cache_key: str, url: str, payload: Optional[Dict[str, Any]]):
+        body = self._shared_cache.get(cache_key)
+        if body is not None:
+            return body
+        if self._shared_cache.acquire_lease(cache_key, self._shared_cache_lease_seconds):
+            try:
+                body = self._fetch(url, payload)
+                self._shared_cache.set(cache_key, body)
+            finally:
+                self._shared_cache.release_lease(cache_key)
+            return body
+        # Another replica is refreshing this entry, use its result rather than fetching it again
+        body = self._shared_cache.wait_for(cache_key, timeout=self._shared_cache_lease_seconds)
+        return body if body is not None else self._fetch(url, payload)
+
+    def _fetch(self, url: str, payload: Optional[Dict[str, Any]]):
         try:
-            self._calls_made += 1
-            response = self.session.get(url + self._shortcut_token)
-            # Add this URL to session state
-            st.session_state[url] = response.json()
-            response.raise_for_status()
+            self._wait_for_rate_limit()
+            with self._lock:
+                self._calls_made += 1
+            if payload is not None:
+                validator = None
+                response = self.session.post(self._with_token(url), json=payload)
+            else:
+                validator = self._validators.get(url)
+                response = self.session.get(self._with_token(url), headers=self._conditional_headers(validator))
+            if response.status_code == 304 and validator is not None:
+                # Unchanged upstream, reuse the body we parsed last time
+                with self._lock:
+                    self._not_modified += 1
+                    self._bytes_saved += validator['size']
+                body = validator['body']
+            else:
+                response.raise_for_status()
+                body = response.json()
+                self._record_transfer(url, response, body, cacheable=payload is None)
         except requests.exceptions.RequestException as e:
             print(e)
             sys.exit(1)
-        return response.json()
+        return body
+
+    def _with_token(self, url: str) -> str:
+        return url + ('&' if '?' in url else '?') + self._shortcut_token
+
+    @staticmethod
+    def _conditional_headers(validator: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {}
+        if validator is not None:
+            if validator['etag']:
+                headers['If-None-Match'] = validator['etag']
+            if validator['last_modified']:
+                headers['If-Modified-Since'] = validator['last_modified']
+        return headers
+
+    def _record_transfer(self, url: str, response, body, cacheable: bool = True):
+        size = len(response.content)
+        wire_size = int(response.headers.get('Content-Length', size))
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        with self._lock:
+            self._bytes_received += wire_size
+            # gzip savings: decoded body size minus what actually came over the wire
+            self._bytes_saved += max(size - wire_size, 0)
+            if cacheable and (etag or last_modified):
+                self._validators[url] = {'etag': etag, 'last_modified': last_modified, 'body': body, 'size': size}
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'calls_made': self._calls_made,
+                'not_modified': self._not_modified,
+                'bytes_received': self._bytes_received,
+                'bytes_saved': self._bytes_saved,
+            }
 
     def get_workflow(self, workflow_id):
         return self._workflows_dict[workflow_id]
@@ -96,17 +337,57 @@ class ApiRouter:
 
     def _do_get_iterations_and_load_cache(self):
         all_iterations = self.make_api_call(self._base_url + self._get_iteration_url)
-        self._all_sprints = all_iterations
+        iteration_map = dict(self._iteration_map)
         for iteration in all_iterations:
-            self._iteration_map[iteration['id']] = iteration
-            self._iteration_map[iteration['name']] = iteration
+            iteration_map[iteration['id']] = iteration
+            iteration_map[iteration['name']] = iteration
+        # Swapped in whole, map first: other threads see either the old or the complete new iterations
+        with self._lock:
+            self._iteration_map = iteration_map
+            self._all_sprints = all_iterations
 
     def get_epics_for_milestone(self, milestone_id: int) -> List[Dict[str, Any]]:
-        if milestone_id not in self._milestone_epic_mappings:
+        # Read once into a local: a refresh from another session may empty the mapping in between
+        epic_list = self._milestone_epic_mappings.get(milestone_id)
+        if epic_list is None:
             url = f"{self._base_url}{self._get_milestones_url}/{milestone_id}/epics"
             epic_list = self.make_api_call(url)
-            self._milestone_epic_mappings[milestone_id] = epic_list
-        return self._milestone_epic_mappings[milestone_id]
+            with self._lock:
+                self._milestone_epic_mappings[milestone_id] = epic_list
+        return epic_list
+
+    def _load_all_milestone_epic_mappings(self, milestone_ids: List[int]):
+        # One listing of every epic instead of a /milestones/{id}/epics request per milestone
+        missing = [mid for mid in milestone_ids if mid not in self._milestone_epic_mappings]
+        if not missing:
+            return
+        epics_by_milestone: Dict[int, List[Dict[str, Any]]] = {mid: [] for mid in missing}
+        for epic in self.make_api_call(self._base_url + self._get_epics_url):
+            if epic.get('milestone_id') in epics_by_milestone:
+                epics_by_milestone[epic['milestone_id']].append(epic)
+        with self._lock:
+            self._milestone_epic_mappings.update(epics_by_milestone)
+
+    def load_stories_for_milestones(self, milestone_ids: List[int]):
+        """
+        Fill the milestone -> epics and epic -> stories mappings for a set of milestones using one epic listing
+        and a few bulk story searches, rather than one request per milestone plus one per epic.
+        :param milestone_ids: milestones whose epics and stories should be loaded
+        """
+        self._load_all_milestone_epic_mappings(milestone_ids)
+        epic_ids = [e['id'] for mid in milestone_ids for e in self.get_epics_for_milestone(mid)
+                    if e['id'] not in self._epic_story_mappings]
+        for i in range(0, len(epic_ids), self._search_epics_per_request):
+            chunk = epic_ids[i:i + self._search_epics_per_request]
+            stories_by_epic: Dict[int, List[Dict[str, Any]]] = {epic_id: [] for epic_id in chunk}
+            # Story listings leave descriptions out unless asked, and the similarity and search indexes read them
+            stories = self.make_api_call(self._base_url + self._search_stories_url,
+                                         payload={'epic_ids': chunk, 'includes_description': True})
+            for story in self._ingest_stories(stories):
+                if story.get('epic_id') in stories_by_epic:
+                    stories_by_epic[story['epic_id']].append(story)
+            with self._lock:
+                self._epic_story_mappings.update(stories_by_epic)
 
     def get_all_stories_for_milestone(self, milestone_id, sprint=None) -> List[Dict[str, Any]]:
         stories: List[Dict[str, Any]] = []
@@ -124,26 +405,81 @@ class ApiRouter:
         return stories
 
     def get_stories_for_epic(self, epic_id, sprint=None):
-        if epic_id not in self._epic_story_mappings:
-            stories_list = self.make_api_call(self._base_url + self._get_epics_url + "/{}/stories".format(epic_id))
-            self._epic_story_mappings[epic_id] = stories_list
-        stories_list = self._epic_story_mappings[epic_id]
+        stories_list = self._epic_story_mappings.get(epic_id)
+        if stories_list is None:
+            stories_list = self._ingest_stories(
+                self.make_api_call(self._base_url + self._get_epics_url +
+                                   "/{}/stories?includes_description=true".format(epic_id)))
+            with self._lock:
+                self._epic_story_mappings[epic_id] = stories_list
         if sprint is not None:
             stories_list = [s for s in stories_list if
                             s['iteration_id'] is not None and sprint == self.get_iteration_name_from_id(
                                 s['iteration_id']) and not s.get('archived', '')]
         return stories_list
 
+    def _ingest_stories(self, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Pull the tenant's configured custom fields out into flat columns once, as stories arrive
+        for story in stories:
+            self.get_custom_field_columns(story)
+            self.get_state_class(story)
+        self.change_log.record(stories)
+        return stories
+
+    def get_state_class(self, story: Dict[str, Any]) -> int:
+        """
+        :return: the STATE_* bit flags of the story's workflow state, cached on the story
+        """
+        if 'state_class' not in story:
+            story['state_class'] = self._state_classes.get(story.get('workflow_state_id'), 0)
+        return story['state_class']
+
+    def get_custom_field_columns(self, story: Dict[str, Any]) -> Dict[str, Any]:
+        if 'custom_field_columns' not in story:
+            values = {cf['field_id']: cf['value'] for cf in story.get('custom_fields', [])}
+            story['custom_field_columns'] = {name: values.get(field_id)
+                                             for name, field_id in self.tenant.custom_fields.items()}
+        return story['custom_field_columns']
+
+    def get_loaded_stories(self) -> List[Dict[str, Any]]:
+        # Every story loaded so far through the epic -> stories mappings
+        with self._lock:
+            return [s for stories in self._epic_story_mappings.values() for s in stories]
+
     def get_story_by_id(self, story_id):
         story = self.make_api_call(self._base_url + self._get_stories_url + "/{}".format(story_id))
         return story
 
+    def get_stories_by_ids(self, story_ids: List) -> List[Dict[str, Any]]:
+        """
+        get_story_by_id for several stories, fetched concurrently over the router's connection pool
+        :return: the stories, in the order of story_ids
+        """
+        # Worker threads need the viewer's script context to reach the session state URL cache
+        ctx = get_script_run_ctx()
+
+        def fetch(story_id):
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            return self.get_story_by_id(story_id)
+
+        with ThreadPoolExecutor(max_workers=self.tenant.pool_maxsize) as executor:
+            return list(executor.map(fetch, story_ids))
+
     def get_milestones(self, active=False):
         if len(self._all_milestones) == 0:
             # Lazy call
             milestones = self.make_api_call(self._base_url + self._get_milestones_url)
-            self._all_milestones.update({m['id']: m for m in milestones if m['id'] not in self._special_milestone_ids and m.get('completed') is False})
-            self._special_milestones.update({m['id']: m for m in milestones if m['id'] in self._special_milestone_ids})
+            all_milestones = {m['id']: m for m in milestones if m['id'] not in self._special_milestone_ids and m.get('completed') is False}
+            special_milestones = {m['id']: m for m in milestones if m['id'] in self._special_milestone_ids}
+            milestones_by_completion = sorted(
+                (datetime.fromisoformat(m['completed_at_override'].replace('Z', '+00:00')).date(), m['id'])
+                for m in all_milestones.values() if m.get('completed_at_override'))
+            # _all_milestones last, since it is what other threads check to see whether milestones are loaded
+            with self._lock:
+                self._special_milestones = special_milestones
+                self._milestones_by_completion = milestones_by_completion
+                self._all_milestones = all_milestones
 
         milestones = self._all_milestones.values()
 
@@ -159,15 +495,50 @@ class ApiRouter:
                              ]
         return active_milestones
 
+    def get_milestones_by_completion_band(self, band_starts: List[date], until: date) -> List[List[Dict]]:
+        """
+        Bucket milestones by completion date in a single pass over the date-sorted milestone index.
+        :param band_starts: band start dates, most recent first. Band 0 covers [band_starts[0], until],
+                            band i covers [band_starts[i], band_starts[i - 1])
+        :param until: inclusive end date of the most recent band
+        :return: one list of milestones per band
+        """
+        if len(self._all_milestones) == 0:
+            self.get_milestones()
+        ascending_starts = band_starts[::-1]
+        dates = [d for d, _ in self._milestones_by_completion]
+        lo = bisect.bisect_left(dates, ascending_starts[0])
+        hi = bisect.bisect_right(dates, until)
+        bands: List[List[Dict]] = [[] for _ in band_starts]
+        for completed_on, milestone_id in self._milestones_by_completion[lo:hi]:
+            band = len(band_starts) - bisect.bisect_right(ascending_starts, completed_on)
+            bands[band].append(self._all_milestones[milestone_id])
+        return bands
+
     def get_special_milestones(self) -> List:
         return list(self._special_milestones.values())
 
+    def get_general_milestone(self) -> Dict:
+        if len(self._all_milestones) == 0:
+            self.get_milestones()
+        return self._special_milestones[self.tenant.general_milestone_id]
+
     def get_milestone_from_id(self, milestone_id):
         return self._all_milestones[milestone_id]
 
     def get_milestone_from_epic_id(self, epic_id):
-        return next((self._all_milestones.get(mid) or self._special_milestones.get(mid) for mid, epics in
-                     self._milestone_epic_mappings.items() for epic in epics if epic['id'] == epic_id), None)
+        with self._lock:
+            return next((self._all_milestones.get(mid) or self._special_milestones.get(mid) for mid, epics in
+                         self._milestone_epic_mappings.items() for epic in epics if epic['id'] == epic_id), None)
+
+    def get_epic_and_milestone_names(self) -> Dict[int, Tuple[str, Optional[str]]]:
+        """
+        :return: epic id -> (epic name, milestone name), over the epics loaded for milestones
+        """
+        with self._lock:
+            mappings = list(self._milestone_epic_mappings.items())
+            milestones = {**self._special_milestones, **self._all_milestones}
+        return {e['id']: (e['name'], milestones.get(mid, {}).get('name')) for mid, epics in mappings for e in epics}
 
     def get_milestone_from_story(self, story):
         return self.get_milestone_from_epic_id(story['epic_id'])
@@ -215,8 +586,17 @@ class ApiRouter:
             return None
 
     def get_iteration_from_name(self, iteration_name):
+        if iteration_name not in self._iteration_map:
+            # Lazy load
+            self._do_get_iterations_and_load_cache()
         return self._iteration_map[iteration_name]
 
+    def get_epic_ids_for_name(self, epic_name: str) -> List[int]:
+        # Resolved from the epics already loaded for milestones, without a request per story
+        with self._lock:
+            return [e['id'] for epics in self._milestone_epic_mappings.values() for e in epics
+                    if e['name'].strip() == epic_name]
+
     # given an Epic ID, get the epic name
     def get_epic_name(self, epic_id) -> str:
         url = self._base_url + self._get_epics_url + "/{}".format(epic_id)
@@ -228,7 +608,7 @@ class ApiRouter:
         epics = []
         # if sprint is none, get all epics
         # else get epics for the current sprint
-        milestones_in_sprint = self.get_milestones(active=True) + [self.get_special_milestones()[1]]
+        milestones_in_sprint = self.get_milestones(active=True) + [self.get_general_milestone()]
         for milestone in milestones_in_sprint:
             epics.extend(self.get_epics_for_milestone(milestone['id']))
         return epics
@@ -0,0 +1,106 @@
+import threading
+import numpy as np
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Tuple, Hashable
+from dates import parse_day
+
+
+class _Series:
+    def __init__(self, start: date, end: date):
+        self.start = start
+        self.num_days = max((end - start).days + 1, 1)
+        # Per-day event counts; the cumulative series are their running sums
+        self.created = np.zeros(self.num_days, dtype=np.int64)
+        self.started = np.zeros(self.num_days, dtype=np.int64)
+        self.completed = np.zeros(self.num_days, dtype=np.int64)
+        # story id -> (version, day indexes the story contributed to created / started / completed)
+        self.contributions: Dict[int, Tuple[Optional[str], Tuple]] = {}
+
+    def _day_index(self, day: Optional[date], clamp_early: bool) -> Optional[int]:
+        if day is None:
+            return None
+        idx = (day - self.start).days
+        if idx >= self.num_days:
+            return None
+        if idx < 0:
+            # Work that happened before the window opened counts from its first day
+            return 0 if clamp_early else None
+        return idx
+
+    def _apply(self, indexes: Tuple, sign: int):
+        for events, idx in zip((self.created, self.started, self.completed), indexes):
+            if idx is not None:
+                events[idx] += sign
+
+    def update(self, story: Dict) -> bool:
+        version = story.get('updated_at')
+        previous = self.contributions.get(story['id'])
+        if previous is not None and previous[0] == version:
+            return False
+        if previous is not None:
+            self._apply(previous[1], -1)
+        indexes = (self._day_index(parse_day(story.get('created_at')), clamp_early=True),
+                   self._day_index(parse_day(story.get('started_at')), clamp_early=True),
+                   self._day_index(parse_day(story.get('completed_at')) if story.get('completed') else None,
+                                   clamp_early=True))
+        self._apply(indexes, 1)
+        self.contributions[story['id']] = (version, indexes)
+        return True
+
+    def remove(self, story_id: int):
+        self._apply(self.contributions.pop(story_id)[1], -1)
+
+
+class BurndownEngine:
+    """
+    Per-day burndown / burnup series for sprints and milestones, built from story created / started /
+    completed timestamps. Each series is kept up to date incrementally: a sync only re-parses the stories
+    whose `updated_at` changed since the last sync, and backs out stories that left the series.
+    """
+
+    def __init__(self):
+        self._series: Dict[Hashable, _Series] = {}
+        # Guards _series
+        self._lock = threading.Lock()
+
+    def sync(self, key: Hashable, start: date, end: date, stories: List[Dict]) -> int:
+        """
+        :param key: series identifier, e.g. ('sprint', name) or ('milestone', id)
+        :param start: first day of the series
+        :param end: last day of the series
+        :param stories: every story currently in the series
+        :return: number of stories that were (re)applied
+        """
+        with self._lock:
+            series = self._series.get(key)
+            if series is None or series.start != start or series.num_days != (end - start).days + 1:
+                series = self._series[key] = _Series(start, end)
+            current_ids = {s['id'] for s in stories}
+            for story_id in [sid for sid in series.contributions if sid not in current_ids]:
+                series.remove(story_id)
+            return sum(series.update(s) for s in stories)
+
+    def has_series(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._series
+
+    def get_series(self, key: Hashable, until: Optional[date] = None) -> Dict[str, List]:
+        """
+        :param until: last day to return, defaults to the end of the series. Later days have no data yet
+        :return: Date, Scope, Started, Completed and Remaining per day
+        """
+        with self._lock:
+            series = self._series[key]
+            num_days = series.num_days
+            if until is not None:
+                num_days = min(max((until - series.start).days + 1, 0), series.num_days)
+            scope = np.cumsum(series.created)[:num_days]
+            started = np.cumsum(series.started)[:num_days]
+            completed = np.cumsum(series.completed)[:num_days]
+        return {
+            'Date': [(series.start + timedelta(days=i)).isoformat() for i in range(num_days)],
+            'Scope': scope.tolist(),
+            'Started': started.tolist(),
+            'Completed': completed.tolist(),
+            'Remaining': (scope - completed).tolist(),
+        }
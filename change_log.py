@@ -0,0 +1,95 @@
+import bisect
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Iterable
+
+
+class ChangeLog:
+    """
+    Story changes seen by a router as it syncs stories: new stories, workflow state transitions and owner
+    changes. Each story's last seen state is kept so that a sync only compares the stories whose
+    `updated_at` moved. Entries older than the retention window are dropped, so memory stays bounded.
+    """
+
+    def __init__(self, retention_seconds: int = 7 * 24 * 3600, max_entries: int = 10000):
+        self.retention_seconds = retention_seconds
+        self.max_entries = max_entries
+        self.version = 0
+        # Only stories created after this are logged as new, the rest of the first sync is the baseline
+        self._started_at = time.time()
+        self._entries: List[Dict] = []
+        self._times: List[float] = []
+        # story id -> (updated_at, workflow_state_id, owner_ids, last seen)
+        self._known: Dict[int, Tuple[Optional[str], Optional[int], Tuple, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _timestamp(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+    def _entry(self, now: float, story: Dict, change: str, old=None, new=None) -> Dict:
+        return {'version': self.version, 'time': now, 'story_id': story['id'], 'name': story.get('name'),
+                'app_url': story.get('app_url'), 'change': change, 'old': old, 'new': new}
+
+    def record(self, stories: Iterable[Dict], now: Optional[float] = None) -> int:
+        """
+        :return: number of changes logged
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            self.version += 1
+            added = []
+            for story in stories:
+                owners = tuple(story.get('owner_ids', []))
+                known = self._known.get(story['id'])
+                self._known[story['id']] = (story.get('updated_at'), story.get('workflow_state_id'), owners, now)
+                if known is None:
+                    created_at = self._timestamp(story.get('created_at'))
+                    if created_at is not None and created_at > self._started_at:
+                        added.append(self._entry(now, story, 'created', new=story.get('workflow_state_id')))
+                    continue
+                if known[0] == story.get('updated_at'):
+                    continue
+                if known[1] != story.get('workflow_state_id'):
+                    added.append(self._entry(now, story, 'state', known[1], story.get('workflow_state_id')))
+                if known[2] != owners:
+                    added.append(self._entry(now, story, 'owner', list(known[2]), list(owners)))
+            if not added:
+                self.version -= 1
+            self._entries.extend(added)
+            self._times.extend(now for _ in added)
+            self._prune(now)
+            return len(added)
+
+    def _prune(self, now: float):
+        cutoff = now - self.retention_seconds
+        drop = max(bisect.bisect_right(self._times, cutoff), len(self._entries) - self.max_entries)
+        if drop > 0:
+            del self._entries[:drop]
+            del self._times[:drop]
+        if len(self._known) > 2 * len(self._entries) + 10000:
+            # Forget stories that have not been synced within the window
+            self._known = {sid: k for sid, k in self._known.items() if k[3] > cutoff}
+
+    def get_changes(self, since: float) -> List[Dict]:
+        """
+        :param since: epoch seconds
+        :return: changes logged after `since`, oldest first
+        """
+        with self._lock:
+            return self._entries[bisect.bisect_right(self._times, since):]
+
+    def get_states_at(self, at: float) -> Dict[int, Optional[int]]:
+        """
+        :param at: epoch seconds
+        :return: story id -> workflow state id at `at`, for the stories logged changing state since
+        """
+        states: Dict[int, Optional[int]] = {}
+        with self._lock:
+            for entry in self._entries[bisect.bisect_right(self._times, at):]:
+                if entry['change'] == 'state':
+                    states.setdefault(entry['story_id'], entry['old'])
+        return states
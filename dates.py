@@ -0,0 +1,12 @@
+from datetime import datetime, date
+from typing import Optional
+
+
+def parse_day(timestamp: Optional[str]) -> Optional[date]:
+    """
+    :param timestamp: a Shortcut ISO 8601 timestamp, e.g. 2023-05-01T10:00:00Z
+    :return: its date, None when there is no timestamp
+    """
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).date()
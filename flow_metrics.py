@@ -0,0 +1,92 @@
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Hashable
+from api_router import ApiRouter, STATE_REVIEW, STATE_TRIAGE
+
+
+class FlowMetrics:
+    """
+    Lead time (created -> completed) and cycle time (started -> completed) per story, plus how long stories
+    currently in Triage or In Review have been there (from `moved_at`). Stories are turned into one
+    DataFrame per data version; percentiles by owner, epic, milestone or story type are group-bys over it.
+    """
+
+    def __init__(self, r: ApiRouter):
+        self.r = r
+        self._frames: Dict[Hashable, pd.DataFrame] = {}
+        self._max_frames = 8
+        # Guards _frames
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_datetime(values: List[Optional[str]]) -> pd.Series:
+        return pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce')
+
+    def get_frame(self, stories: List[Dict], now: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        :return: one row per story with its groups, Lead Time / Cycle Time for completed stories and
+            Days In State for stories in Triage or In Review, in days
+        """
+        now = now or datetime.now(timezone.utc)
+        cache_key = (now.date(), hash(tuple((s['id'], s.get('updated_at')) for s in stories)))
+        with self._lock:
+            if cache_key in self._frames:
+                return self._frames[cache_key]
+
+        epic_names = self.r.get_epic_and_milestone_names()
+        created = self._to_datetime([s.get('created_at') for s in stories])
+        started = self._to_datetime([s.get('started_at') for s in stories])
+        completed = self._to_datetime([s.get('completed_at') if s.get('completed') is True else None for s in stories])
+        moved = self._to_datetime([s.get('moved_at') for s in stories])
+        state_classes = np.array([self.r.get_state_class(s) for s in stories], dtype=np.int64)
+        day = pd.Timedelta(days=1)
+        waiting = ((state_classes & (STATE_TRIAGE | STATE_REVIEW)) != 0)
+        frame = pd.DataFrame({
+            'ID': [s['id'] for s in stories],
+            'Story': [f"{s['name']}###{s['app_url']}" for s in stories],
+            'Owner': [self.r.get_members(s['owner_ids'][0]) if s['owner_ids'] else None for s in stories],
+            'Epic': [epic_names.get(s.get('epic_id'), (None, None))[0] for s in stories],
+            'Milestone': [epic_names.get(s.get('epic_id'), (None, None))[1] for s in stories],
+            'Type': [s.get('story_type') for s in stories],
+            'State': [self.r.get_workflow(s['workflow_state_id']) for s in stories],
+            'Completed At': completed,
+            'Lead Time': (completed - created) / day,
+            'Cycle Time': (completed - started) / day,
+            'Days In State': ((pd.Timestamp(now) - moved) / day).where(waiting),
+        })
+
+        with self._lock:
+            if len(self._frames) >= self._max_frames:
+                self._frames.pop(next(iter(self._frames)))
+            self._frames[cache_key] = frame
+        return frame
+
+    @staticmethod
+    def get_completed(frame: pd.DataFrame, since: Optional[datetime] = None) -> pd.DataFrame:
+        completed = frame[frame['Completed At'].notna()]
+        if since is not None:
+            completed = completed[completed['Completed At'] >= pd.Timestamp(since)]
+        return completed
+
+    @staticmethod
+    def get_percentiles(frame: pd.DataFrame, by: str, columns: List[str],
+                        quantiles: tuple = (0.5, 0.85)) -> pd.DataFrame:
+        """
+        :return: one row per group with its number of stories and each column's quantiles, in days
+        """
+        if frame.empty:
+            return pd.DataFrame(columns=[by, 'Stories'] + [f'{c} P{int(q * 100)}' for c in columns for q in quantiles])
+        grouped = frame.fillna({by: '-'}).groupby(by)
+        table = grouped[columns].quantile(list(quantiles)).unstack()
+        table.columns = [f'{c} P{int(q * 100)}' for c, q in table.columns]
+        table.insert(0, 'Stories', grouped.size())
+        return table.round(1).sort_values('Stories', ascending=False).reset_index()
+
+    @staticmethod
+    def get_overall_percentiles(frame: pd.DataFrame, column: str, quantiles: tuple = (0.5, 0.85)) -> List[float]:
+        values = frame[column].dropna().to_numpy()
+        if len(values) == 0:
+            return [float('nan')] * len(quantiles)
+        return np.round(np.quantile(values, quantiles), 1).tolist()
@@ -0,0 +1,91 @@
+import threading
+import numpy as np
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Optional, Hashable
+
+from dates import parse_day
+
+
+class MilestoneForecaster:
+    """
+    Monte Carlo completion forecasts for milestones. Each simulation draws weekly throughputs from the
+    milestone's own recent weeks (completed stories per week, from completed_at, over at most history_weeks
+    weeks and none from before the milestone started) until the remaining stories are done; all
+    simulations run at once as one NumPy array. Forecasts are cached per data
+    version, so reruns over unchanged stories do not simulate again.
+    """
+
+    def __init__(self, n_simulations: int = 10000, history_weeks: int = 12, max_weeks: int = 104):
+        self.n_simulations = n_simulations
+        self.history_weeks = history_weeks
+        # Simulations that have not finished after max_weeks count as not finishing at all
+        self.max_weeks = max_weeks
+        self._forecasts: Dict[Hashable, Optional[Dict]] = {}
+        self._max_forecasts = 256
+        # Guards _forecasts
+        self._lock = threading.Lock()
+
+    def get_weekly_throughput(self, stories: List[Dict], today: date, since: Optional[date] = None) -> np.ndarray:
+        """
+        :param since: the milestone's start. Defaults to its first completion
+        :return: completed stories in each of the last history_weeks weeks, or in each week since `since`
+            if that is fewer, oldest first
+        """
+        completed_days = [parse_day(s.get('completed_at')) for s in stories if s.get('completed') is True]
+        completed_days = [d for d in completed_days if d is not None]
+        since = since or min(completed_days, default=today)
+        # Weeks from before the milestone started would only add zero throughput weeks
+        n_weeks = min(max((today - since).days // 7 + 1, 1), self.history_weeks)
+        throughput = np.zeros(n_weeks, dtype=np.int64)
+        for completed_day in completed_days:
+            weeks_ago = (today - completed_day).days // 7
+            if 0 <= weeks_ago < n_weeks:
+                throughput[n_weeks - 1 - weeks_ago] += 1
+        return throughput
+
+    def simulate_weeks(self, remaining: int, throughput: np.ndarray, seed: int = 0) -> np.ndarray:
+        """
+        :return: weeks needed to finish the remaining stories in each simulation, np.inf where they never do
+        """
+        rng = np.random.default_rng(seed)
+        samples = rng.choice(throughput, size=(self.n_simulations, self.max_weeks))
+        done = np.cumsum(samples, axis=1) >= remaining
+        weeks = done.argmax(axis=1).astype(float) + 1
+        weeks[~done[:, -1]] = np.inf
+        return weeks
+
+    def forecast(self, milestone_id: int, stories: List[Dict], today: Optional[date] = None,
+                 started: Optional[date] = None) -> Optional[Dict]:
+        """
+        :param stories: the milestone's stories, done or not
+        :param started: the milestone's start date (started_at_override), if it has one
+        :return: Remaining stories and P50 / P85 completion dates (None when not within max_weeks),
+            or None when the milestone completed nothing in the last history_weeks to forecast from
+        """
+        today = today or datetime.now().date()
+        cache_key = (milestone_id, today, started,
+                     hash(tuple((s['id'], s.get('updated_at'), s.get('completed')) for s in stories)))
+        with self._lock:
+            if cache_key in self._forecasts:
+                return self._forecasts[cache_key]
+
+        remaining = sum(1 for s in stories if s.get('completed') is not True)
+        throughput = self.get_weekly_throughput(stories, today, since=started)
+        if remaining == 0:
+            forecast = {'Remaining': 0, 'P50': today, 'P85': today}
+        elif not throughput.any():
+            forecast = None
+        else:
+            weeks = self.simulate_weeks(remaining, throughput, seed=milestone_id)
+            p50, p85 = np.percentile(weeks, [50, 85], method='higher')
+            forecast = {
+                'Remaining': remaining,
+                'P50': today + timedelta(weeks=p50) if np.isfinite(p50) else None,
+                'P85': today + timedelta(weeks=p85) if np.isfinite(p85) else None,
+            }
+
+        with self._lock:
+            if len(self._forecasts) >= self._max_forecasts:
+                self._forecasts.pop(next(iter(self._forecasts)))
+            self._forecasts[cache_key] = forecast
+        return forecast
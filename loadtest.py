@@ -0,0 +1,424 @@
+"""
+Load test: many simulated viewers rendering the Sprint Dashboard at once, against a fake Shortcut server.
+
+    python loadtest.py --sessions 1,10,25,50 --reruns 2 --latency-ms 50
+    python loadtest.py --summary --latency-ms 50 --token-delay-ms 20
+
+Each session is a Streamlit AppTest running sprint_db.py, so it goes through main() with its own session
+state, like a browser tab would. For every concurrency level this reports render latency (p50 / p95 over
+every run of every session), upstream calls to the fake server, session state size per session and the
+process's resident memory.
+
+With --summary, one member summary is streamed from the fake server's OpenAI-style chat completions
+endpoint instead, reporting the time to its first chunk and to the whole summary.
+"""
+import os
+import re
+import json
+import time
+import pickle
+import random
+import argparse
+import tempfile
+import threading
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sprint_db.py')
+
+
+class FakeShortcutData:
+    """
+    A generated Shortcut workspace shaped like the one the dashboard expects: the special milestones and
+    epics of the default TenantConfig, key milestones with epics and stories, members, a workflow and a
+    current sprint.
+    """
+
+    WORKFLOW_STATES = [(10, 'Triage', 'unstarted'), (11, 'Ready for Development', 'unstarted'),
+                       (12, 'In Development', 'started'), (13, 'In Review', 'started'),
+                       (14, 'Completed', 'done'), (15, 'Unneeded', 'done')]
+
+    def __init__(self, n_milestones: int = 10, epics_per_milestone: int = 3, stories_per_epic: int = 20,
+                 n_members: int = 15, seed: int = 0):
+        rng = random.Random(seed)
+        today = datetime.now().date()
+        words = ['login', 'api', 'runner', 'console', 'export', 'metrics', 'latency', 'dataset', 'upload',
+                 'billing', 'auth', 'search', 'cache', 'alert', 'report', 'timeout', 'retry', 'schema']
+
+        self.workflows = [{'id': 1, 'states': [{'id': i, 'name': n, 'type': t} for i, n, t in self.WORKFLOW_STATES]}]
+        self.members = [{'id': f'member-{i}', 'state': 'full', 'profile': {'name': f'Member {i}'}}
+                        for i in range(n_members)]
+        # Two-week sprints, the last one current
+        sprint_starts = [today - timedelta(days=3 + 14 * (3 - i)) for i in range(4)]
+        self.iterations = [{'id': 100 + i, 'name': f'Sprint {i}', 'start_date': start.isoformat(),
+                            'end_date': (start + timedelta(days=13)).isoformat()}
+                           for i, start in enumerate(sprint_starts)]
+        current_iteration_id = self.iterations[-1]['id']
+
+        self.milestones = [
+            {'id': 3073, 'name': 'No Projects Assigned', 'app_url': 'http://fake/m/3073', 'completed': False,
+             'started_at_override': None, 'completed_at_override': None},
+            {'id': 3077, 'name': 'General Bugs and Improvements', 'app_url': 'http://fake/m/3077', 'completed': False,
+             'started_at_override': None, 'completed_at_override': None},
+        ]
+        self.epics_by_milestone: Dict[int, List[Dict]] = {
+            3073: [],
+            3077: [{'id': 3078, 'name': 'General Bugs', 'state': 'in progress', 'milestone_id': 3077},
+                   {'id': 3079, 'name': 'General one-off Improvements', 'state': 'in progress', 'milestone_id': 3077}],
+        }
+        next_epic_id = 10000
+        for i in range(n_milestones):
+            milestone_id = 1 + i
+            start = today - timedelta(days=rng.randint(10, 90))
+            self.milestones.append({
+                'id': milestone_id, 'name': f'Milestone {milestone_id}', 'app_url': f'http://fake/m/{milestone_id}',
+                'completed': False, 'started_at_override': f'{start.isoformat()}T00:00:00Z',
+                'completed_at_override': f'{(start + timedelta(days=rng.randint(30, 120))).isoformat()}T00:00:00Z',
+            })
+            self.epics_by_milestone[milestone_id] = []
+            for _ in range(epics_per_milestone):
+                self.epics_by_milestone[milestone_id].append({
+                    'id': next_epic_id, 'name': f'Epic {next_epic_id}', 'milestone_id': milestone_id,
+                    'state': rng.choice(['to do', 'in progress', 'done'])})
+                next_epic_id += 1
+
+        self.stories_by_epic: Dict[int, List[Dict]] = {}
+        next_story_id = 1
+        for epics in self.epics_by_milestone.values():
+            for epic in epics:
+                self.stories_by_epic[epic['id']] = []
+                for _ in range(stories_per_epic):
+                    state_id, _, state_type = rng.choice(self.WORKFLOW_STATES)
+                    created = today - timedelta(days=rng.randint(1, 60))
+                    completed = state_type == 'done' and state_id != 15
+                    topic = ' '.join(rng.sample(words, 3))
+                    self.stories_by_epic[epic['id']].append({
+                        'id': next_story_id, 'name': f'{topic} story {next_story_id}',
+                        'app_url': f'http://fake/story/{next_story_id}', 'epic_id': epic['id'],
+                        'story_type': rng.choice(['feature', 'bug', 'chore']), 'workflow_state_id': state_id,
+                        'owner_ids': [rng.choice(self.members)['id']] if rng.random() < 0.9 else [],
+                        'requested_by_id': rng.choice(self.members)['id'],
+                        'custom_fields': [{'field_id': '62f6c112-35ed-4b29-9e07-dd16975ba823',
+                                           'value': rng.choice(['high', 'medium', 'low'])}],
+                        'created_at': f'{created.isoformat()}T10:00:00Z',
+                        'started_at': f'{(created + timedelta(days=1)).isoformat()}T10:00:00Z'
+                        if state_type != 'unstarted' else None,
+                        'completed_at': f'{min(created + timedelta(days=rng.randint(2, 20)), today).isoformat()}T10:00:00Z'
+                        if completed else None,
+                        'updated_at': f'{today.isoformat()}T00:00:00Z', 'completed': completed, 'archived': False,
+                        'iteration_id': current_iteration_id if rng.random() < 0.6 else None,
+                        'labels': [], 'description': f'Work on {topic}. Needs a fix in the {rng.choice(words)} path.',
+                    })
+                    next_story_id += 1
+        self.stories = {s['id']: s for stories in self.stories_by_epic.values() for s in stories}
+        self.epics = [e for epics in self.epics_by_milestone.values() for e in epics]
+
+    @staticmethod
+    def _listed(stories: Optional[List[Dict]], includes_description: bool) -> Optional[List[Dict]]:
+        # Like Shortcut, story listings only carry descriptions when asked to
+        if stories is None or includes_description:
+            return stories
+        return [{k: v for k, v in s.items() if k != 'description'} for s in stories]
+
+    def get(self, path: str, query: Optional[Dict[str, List[str]]] = None):
+        includes_description = (query or {}).get('includes_description') == ['true']
+        if path == '/v3/workflows':
+            return self.workflows
+        if path == '/v3/members':
+            return self.members
+        if path == '/v3/iterations':
+            return self.iterations
+        if path == '/v3/milestones':
+            return self.milestones
+        if path == '/v3/epics':
+            return self.epics
+        patterns = [
+            (r'/v3/members/([\w-]+)$', lambda m: next((x for x in self.members if x['id'] == m), None)),
+            (r'/v3/iterations/(\d+)$', lambda m: next((x for x in self.iterations if x['id'] == int(m)), None)),
+            (r'/v3/milestones/(\d+)/epics$', lambda m: self.epics_by_milestone.get(int(m))),
+            (r'/v3/epics/(\d+)/stories$', lambda m: self._listed(self.stories_by_epic.get(int(m)),
+                                                                  includes_description)),
+            (r'/v3/epics/(\d+)$', lambda m: next((e for e in self.epics if e['id'] == int(m)), None)),
+            (r'/v3/stories/(\d+)$', lambda m: self.stories.get(int(m))),
+        ]
+        for pattern, lookup in patterns:
+            match = re.match(pattern, path)
+            if match:
+                return lookup(match.group(1))
+        return None
+
+    def search_stories(self, payload: Dict) -> List[Dict]:
+        stories = [s for epic_id in payload.get('epic_ids', []) for s in self.stories_by_epic.get(epic_id, [])]
+        return self._listed(stories, payload.get('includes_description') is True)
+
+
+class FakeShortcutServer:
+    """
+    Serves FakeShortcutData over HTTP on localhost, counting calls per endpoint. latency_ms is added to
+    every response, to stand in for the real API's round trip. It also serves an OpenAI-style
+    /v1/chat/completions endpoint that streams SUMMARY one word per chunk, token_delay_ms apart.
+    """
+
+    SUMMARY = ('They are finishing the api latency work and will pick up the export fixes next. '
+               'Nothing is blocked. They completed the login and billing stories this sprint.')
+
+    def __init__(self, data: FakeShortcutData, latency_ms: float = 0, token_delay_ms: float = 0):
+        self.data = data
+        self.latency = latency_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}/api'
+
+    @property
+    def openai_base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}/v1'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, body):
+                time.sleep(server.latency)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                content = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _path(self) -> str:
+                path = self.path.split('?')[0]
+                return path[len('/api'):] if path.startswith('/api') else path
+
+            def _count(self, path: str):
+                # Count by endpoint, not by id
+                with server._lock:
+                    server.calls[re.sub(r'/\d+|/member-\d+', '/{id}', path)] += 1
+
+            def do_GET(self):
+                path = self._path()
+                self._count(path)
+                self._respond(server.data.get(path, parse_qs(urlparse(self.path).query)))
+
+            def _stream_completion(self):
+                # Server-sent events, one chat.completion.chunk per word, like the OpenAI API with stream=True
+                time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for word in server.SUMMARY.split(' '):
+                    time.sleep(server.token_delay)
+                    chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': 'fake', 'choices': [{'index': 0, 'delta': {'content': word + ' '},
+                                                           'finish_reason': None}]}
+                    self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                self.wfile.write(b'data: [DONE]\n\n')
+
+            def do_POST(self):
+                path = self._path()
+                self._count(path)
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if path == '/v1/chat/completions':
+                    if payload.get('stream'):
+                        self._stream_completion()
+                        return
+                    self._respond({'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                                   'model': 'fake', 'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                                       'role': 'assistant', 'content': server.SUMMARY}}]})
+                    return
+                self._respond(server.data.search_stories(payload) if path == '/v3/stories/search' else None)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakeShortcutServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self) -> Counter:
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _session_state_bytes(app_test) -> int:
+    # Pickled size of what the session keeps between reruns: widget values and the router's URL cache
+    total = 0
+    for _, value in app_test.session_state.items():
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            pass
+    return total
+
+
+def run_level(n_sessions: int, reruns: int, server: FakeShortcutServer, timeout: float) -> Dict:
+    """
+    Start n_sessions sessions at once and rerun each of them `reruns` more times.
+    :return: latencies, upstream calls and memory for this concurrency level
+    """
+    from streamlit.testing.v1 import AppTest
+
+    server.reset_calls()
+    sessions = [AppTest.from_file(APP_PATH, default_timeout=timeout) for _ in range(n_sessions)]
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def drive(app_test):
+        nonlocal errors
+        for _ in range(1 + reruns):
+            start = time.perf_counter()
+            app_test.run()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += len(app_test.exception)
+
+    with ThreadPoolExecutor(max_workers=n_sessions) as executor:
+        list(executor.map(drive, sessions))
+
+    calls = server.reset_calls()
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {
+        'sessions': n_sessions,
+        'runs': len(latencies),
+        'errors': errors,
+        'p50_s': round(float(p50), 3),
+        'p95_s': round(float(p95), 3),
+        'max_s': round(max(latencies), 3),
+        'upstream_calls': sum(calls.values()),
+        'upstream_calls_per_session': round(sum(calls.values()) / n_sessions, 1),
+        'state_kb_per_session': round(np.mean([_session_state_bytes(s) for s in sessions]) / 1024, 1),
+        'rss_mb': _rss_mb(),
+        'calls_by_endpoint': dict(calls.most_common()),
+    }
+
+
+def measure_summary_stream(server: FakeShortcutServer, data: FakeShortcutData, n_stories: int = 20) -> Dict:
+    """
+    Stream one member summary of n_stories stories through a headless router and the fake chat completions
+    endpoint. Expects configure_environment to have run.
+    :return: seconds to the first chunk and to the whole summary, and the upstream calls made
+    """
+    from api_router import ApiRouter
+    from tenants import TenantRegistry
+    from utils import Utils
+
+    r = ApiRouter(TenantRegistry.load().get('loadtest'), url_cache={})
+    utils = Utils(r)
+    utils.openai_api_key = 'loadtest'
+    utils.openai_base_url = server.openai_base_url
+    # Loaded like the dashboard does, so the summary reads the stories' descriptions from the router
+    r.load_stories_for_milestones([m['id'] for m in r.get_milestones()] + [r.tenant.general_milestone_id])
+    stories = utils.get_story_table_data(list(data.stories.values())[:n_stories])
+    server.reset_calls()
+    start = time.perf_counter()
+    first_chunk_s, chunks = None, 0
+    for _ in utils.stream_llm_summary_for_stories(stories, 'Member 0', mode='llm'):
+        if first_chunk_s is None:
+            first_chunk_s = time.perf_counter() - start
+        chunks += 1
+    total_s = time.perf_counter() - start
+    calls = server.reset_calls()
+    return {
+        'stories': n_stories,
+        'first_chunk_s': round(first_chunk_s or total_s, 3),
+        'total_s': round(total_s, 3),
+        'chunks': chunks,
+        'calls_by_endpoint': dict(calls.most_common()),
+    }
+
+
+def configure_environment(base_url: str, work_dir: str):
+    """
+    Point the app at the fake server: one tenant with a dummy token, a scratch metrics DB and alert outbox,
+    and the local member summary so no session calls OpenAI.
+    """
+    tenants_path = os.path.join(work_dir, 'tenants.json')
+    with open(tenants_path, 'w') as f:
+        json.dump([{'name': 'loadtest', 'token_env': 'LOADTEST_SHORTCUT_TOKEN', 'base_url': base_url}], f)
+    os.environ['SPRINT_DB_TENANTS'] = tenants_path
+    os.environ['LOADTEST_SHORTCUT_TOKEN'] = 'loadtest'
+    os.environ['SPRINT_METRICS_DB'] = os.path.join(work_dir, 'sprint_metrics.db')
+    os.environ['SPRINT_DB_ALERT_OUTBOX'] = os.path.join(work_dir, 'sprint_alerts.jsonl')
+    os.environ['SPRINT_DB_SUMMARY_MODE'] = 'local'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Sprint Dashboard with concurrent sessions.')
+    parser.add_argument('--sessions', default='1,5,10,25,50', help='Comma separated concurrency levels')
+    parser.add_argument('--reruns', type=int, default=1, help='Reruns per session after its first run')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Latency added to every fake API response')
+    parser.add_argument('--milestones', type=int, default=10)
+    parser.add_argument('--stories-per-epic', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds a single run may take')
+    parser.add_argument('--out', help='Also write the results to this JSON file')
+    parser.add_argument('--summary', action='store_true', help='Measure a streamed member summary instead')
+    parser.add_argument('--summary-stories', type=int, default=20, help='Stories in the streamed member summary')
+    parser.add_argument('--token-delay-ms', type=float, default=20, help='Delay between fake summary chunks')
+    args = parser.parse_args()
+
+    data = FakeShortcutData(n_milestones=args.milestones, stories_per_epic=args.stories_per_epic)
+    server = FakeShortcutServer(data, latency_ms=args.latency_ms, token_delay_ms=args.token_delay_ms).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            configure_environment(server.base_url, work_dir)
+            if args.summary:
+                result = measure_summary_stream(server, data, args.summary_stories)
+                results.append(result)
+                print(json.dumps(result, indent=2))
+            else:
+                print(f"{len(data.stories)} stories, {len(data.epics)} epics, {len(data.milestones)} milestones")
+                print(f"{'sessions':>8} {'runs':>5} {'errors':>6} {'p50 s':>7} {'p95 s':>7} {'max s':>7} "
+                      f"{'calls':>6} {'calls/sess':>10} {'state KB/sess':>13} {'RSS MB':>7}")
+                for n_sessions in [int(n) for n in args.sessions.split(',')]:
+                    result = run_level(n_sessions, args.reruns, server, args.timeout)
+                    results.append(result)
+                    print(f"{result['sessions']:>8} {result['runs']:>5} {result['errors']:>6} {result['p50_s']:>7} "
+                          f"{result['p95_s']:>7} {result['max_s']:>7} {result['upstream_calls']:>6} "
+                          f"{result['upstream_calls_per_session']:>10} {result['state_kb_per_session']:>13} "
+                          f"{result['rss_mb'] or 0:>7.0f}")
+    finally:
+        server.stop()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
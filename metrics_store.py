@@ -0,0 +1,80 @@
+import os
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Optional, Any
+
+
+class MetricsStore:
+    """
+    Per-sprint metric snapshots, written once a sprint has closed. Past sprints are read back from here
+    instead of being recomputed from live Shortcut data, which keeps drifting after the sprint ends.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or os.getenv('SPRINT_METRICS_DB', 'sprint_metrics.db')
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sprint_metrics (
+                    tenant TEXT NOT NULL,
+                    sprint_name TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    completion_rate REAL NOT NULL,
+                    total INTEGER NOT NULL,
+                    done INTEGER NOT NULL,
+                    remaining INTEGER NOT NULL,
+                    bugs INTEGER NOT NULL,
+                    features INTEGER NOT NULL,
+                    owner_counts TEXT NOT NULL,
+                    state_distribution TEXT NOT NULL,
+                    recorded_at TEXT NOT NULL,
+                    PRIMARY KEY (tenant, sprint_name)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def has_snapshot(self, tenant: str, sprint_name: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM sprint_metrics WHERE tenant = ? AND sprint_name = ?",
+                               (tenant, sprint_name)).fetchone()
+        return row is not None
+
+    def save_snapshot(self, tenant: str, sprint_name: str, end_date: str, metrics: Dict[str, Any]):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sprint_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tenant, sprint_name, end_date, metrics['completion_rate'], metrics['total'], metrics['done'],
+                 metrics['remaining'], metrics['bugs'], metrics['features'],
+                 json.dumps(metrics['owner_counts']), json.dumps(metrics['state_distribution']),
+                 datetime.now().isoformat(timespec='seconds')))
+
+    def get_snapshots(self, tenant: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        :param tenant: tenant the sprints belong to
+        :param limit: only return the most recent `limit` sprints
+        :return: snapshots ordered by sprint end date, oldest first
+        """
+        query = "SELECT * FROM sprint_metrics WHERE tenant = ? ORDER BY end_date DESC"
+        params = (tenant,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (tenant, limit)
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(query, params).fetchall()
+        snapshots = []
+        for row in reversed(rows):
+            snapshot = dict(row)
+            snapshot['owner_counts'] = json.loads(snapshot['owner_counts'])
+            snapshot['state_distribution'] = json.loads(snapshot['state_distribution'])
+            snapshots.append(snapshot)
+        return snapshots
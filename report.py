@@ -0,0 +1,143 @@
+"""
+Headless sprint report: the Sprint Dashboard's metrics and tables, without Streamlit or a browser session.
+
+    python report.py --format json --out reports
+    python report.py --tenant platform --sprint "Sprint 42" --format parquet
+    python report.py --checks-only
+
+Every tenant in the registry is reported by default, in parallel, each through its own router.
+Reporting first runs the checks (closed sprint snapshots, alert rules); --checks-only runs just those,
+e.g. from cron so alerts keep firing while nobody has the dashboard open.
+"""
+import os
+import re
+import json
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from api_router import ApiRouter
+from metrics_store import MetricsStore
+from router_pool import RouterPool
+from sprint_db import SprintDashboard
+from tenants import TenantRegistry
+from utils import Utils
+
+FORMATS = ('json', 'csv', 'parquet')
+
+
+def get_current_sprint_name(r: ApiRouter, utils: Utils) -> str:
+    recent_sprints = utils.filter_recent_sprints(r.get_all_sprints())
+    return max(recent_sprints, key=lambda x: x[1])[0]
+
+
+def _split_links(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    # "name###url" cells are only meant for the HTML tables, export them as two columns
+    if df.empty or column not in df.columns:
+        return df
+    split = df[column].str.split('###', n=1, expand=True).reindex(columns=[0, 1])
+    df = df.copy()
+    df[column] = split[0]
+    df.insert(df.columns.get_loc(column) + 1, 'URL', split[1])
+    return df
+
+
+def build_sprint_report(r: ApiRouter, utils: Utils, sprint_name: Optional[str] = None,
+                        metrics_store: Optional[MetricsStore] = None) -> Dict:
+    sprint_name = sprint_name or get_current_sprint_name(r, utils)
+    sdb = SprintDashboard(r, utils, iteration_name=sprint_name, metrics_store=metrics_store)
+    data = sdb.load_sprint_data()
+    key_bugs, key_features = data['key_bugs'], data['key_features']
+    general_bugs, general_features = data['general_bugs'], data['general_features']
+    all_stories = key_bugs + key_features + general_bugs + general_features
+
+    metrics = sdb.get_sprint_metrics(key_bugs, key_features, general_bugs, general_features, data['owner_index'])
+    post_deployment_df, needs_attention_df = sdb.get_past_milestones(
+        data['key_milestones'], [sdb.N_WEEKS_POST_DEPLOYMENT, sdb.N_WEEKS_NEEDS_ATTENTION])
+    tables = {
+        'stories': _split_links(pd.DataFrame(utils.get_story_table_data(all_stories)), 'Story'),
+        'active_milestones': _split_links(pd.DataFrame(sdb.get_milestone_data_view(data['key_milestones'])),
+                                          'Milestone'),
+        'post_deployment_milestones': _split_links(post_deployment_df, 'Milestone'),
+        'milestones_needing_attention': _split_links(needs_attention_df, 'Milestone'),
+        'milestone_forecasts': _split_links(pd.DataFrame(sdb.get_forecast_data_view(
+            data['key_milestones_extended'], data['milestone_forecasts'])), 'Milestone'),
+        'epic_story_counts': pd.DataFrame(sdb.get_epic_story_counts()),
+        'new_by_day': pd.DataFrame(sdb.new_bugs_features_grouped_by_day(all_stories)),
+        'owner_counts': pd.DataFrame({'Owner': list(metrics['owner_counts'].keys()),
+                                      'Stories': list(metrics['owner_counts'].values())}),
+        'state_distribution': pd.DataFrame({'State': list(metrics['state_distribution'].keys()),
+                                            'Stories': list(metrics['state_distribution'].values())}),
+    }
+    return {'tenant': r.tenant.name, 'sprint': sprint_name, 'metrics': metrics, 'tables': tables}
+
+
+def write_report(report: Dict, out_dir: str, fmt: str) -> str:
+    """
+    :return: path of the written json file, or of the directory holding one file per table for csv/parquet
+    """
+    name = re.sub(r'[^\w.-]+', '_', f"{report['tenant']}_{report['sprint']}")
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == 'json':
+        path = os.path.join(out_dir, name + '.json')
+        body = {
+            'tenant': report['tenant'],
+            'sprint': report['sprint'],
+            'metrics': report['metrics'],
+            'tables': {k: json.loads(df.to_json(orient='records', date_format='iso'))
+                       for k, df in report['tables'].items()},
+        }
+        with open(path, 'w') as f:
+            json.dump(body, f, indent=2)
+        return path
+
+    path = os.path.join(out_dir, name)
+    os.makedirs(path, exist_ok=True)
+    scalar_metrics = {k: v for k, v in report['metrics'].items() if not isinstance(v, dict)}
+    tables = {'metrics': pd.DataFrame([scalar_metrics]), **report['tables']}
+    for table_name, df in tables.items():
+        if fmt == 'csv':
+            df.to_csv(os.path.join(path, table_name + '.csv'), index=False)
+        else:
+            df.to_parquet(os.path.join(path, table_name + '.parquet'), index=False)
+    return path
+
+
+def run(tenant_names: List[str], sprint_name: Optional[str], out_dir: str, fmt: str,
+        registry: Optional[TenantRegistry] = None, checks_only: bool = False) -> List[str]:
+    """
+    :return: paths of the written reports, or the tenants checked when checks_only
+    """
+    # Headless routers keep their URL cache in a plain dict instead of Streamlit's session state
+    router_pool = RouterPool(registry or TenantRegistry.load(), url_cache_factory=dict)
+    metrics_store = MetricsStore()
+
+    def report_tenant(tenant_name):
+        r, utils = router_pool.get(tenant_name)
+        SprintDashboard(r, utils, metrics_store=metrics_store).run_checks()
+        if checks_only:
+            return tenant_name
+        return write_report(build_sprint_report(r, utils, sprint_name, metrics_store), out_dir, fmt)
+
+    with ThreadPoolExecutor(max_workers=max(len(tenant_names), 1)) as executor:
+        return list(executor.map(report_tenant, tenant_names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write sprint reports without running the dashboard.')
+    parser.add_argument('--tenant', action='append', help='Tenant to report on, may be repeated. Defaults to all')
+    parser.add_argument('--sprint', help='Sprint name. Defaults to the most recent sprint of each tenant')
+    parser.add_argument('--format', choices=FORMATS, default='json')
+    parser.add_argument('--out', default='reports', help='Output directory')
+    parser.add_argument('--checks-only', action='store_true',
+                        help='Only snapshot closed sprints and run the alert rules, write no reports')
+    args = parser.parse_args()
+
+    registry = TenantRegistry.load()
+    for path in run(args.tenant or registry.names(), args.sprint, args.out, args.format, registry,
+                    checks_only=args.checks_only):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import threading
+from typing import Dict, List, Tuple, Optional, Callable, MutableMapping
+from api_router import ApiRouter
+from shared_cache import SharedCache
+from tenants import TenantRegistry
+from utils import Utils
+
+
+class RouterPool:
+    """
+    One ApiRouter (and its Utils) per tenant, created on first use. Each router has its own HTTP
+    connection pool, caches and rate-limit budget, so a busy team cannot slow down another team's dashboard.
+
+    A router and everything its Utils holds (burndown, forecaster, flow metrics, story indexes, alert engine,
+    owner index and summary caches) is shared by every session and rerun of the process, see get_router_pool
+    in sprint_db.py, and by report.py's worker threads. So each of those objects guards its mutable state with
+    its own lock. Work that does not need the state, like building a DataFrame or running a simulation, is
+    done outside of the lock and its result stored under it.
+    """
+
+    def __init__(self, registry: TenantRegistry, url_cache_factory: Optional[Callable[[], MutableMapping]] = None,
+                 shared_cache: Optional[SharedCache] = None):
+        """
+        :param registry: tenants to serve
+        :param url_cache_factory: builds each router's URL cache. Defaults to the viewer's Streamlit session state
+        :param shared_cache: cache tier shared with other replicas, used by every router
+        """
+        self._registry = registry
+        self._url_cache_factory = url_cache_factory
+        self._shared_cache = shared_cache
+        self._routers: Dict[str, Tuple[ApiRouter, Utils]] = {}
+        self._lock = threading.Lock()
+
+    def tenant_names(self) -> List[str]:
+        return self._registry.names()
+
+    def get(self, tenant_name: str) -> Tuple[ApiRouter, Utils]:
+        if tenant_name not in self._routers:
+            with self._lock:
+                if tenant_name not in self._routers:
+                    url_cache = self._url_cache_factory() if self._url_cache_factory is not None else None
+                    router = ApiRouter(self._registry.get(tenant_name), url_cache=url_cache,
+                                       shared_cache=self._shared_cache)
+                    self._routers[tenant_name] = (router, Utils(router))
+        return self._routers[tenant_name]
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import zlib
+import uuid
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Optional
+
+
+class SharedCache(ABC):
+    """
+    Cache tier shared by every dashboard replica. Values are stored as compressed JSON. Refreshes are
+    coordinated through leases: the replica holding a key's lease fetches it upstream, the others wait
+    for its result instead of making the same request.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        # Identifies this replica as a lease holder
+        self._owner = uuid.uuid4().hex
+
+    @staticmethod
+    def _dumps(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+
+    @staticmethod
+    def _loads(blob: bytes) -> Any:
+        return json.loads(zlib.decompress(blob))
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """
+        :return: the fresh value stored under key, None when there is none
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        pass
+
+    @abstractmethod
+    def acquire_lease(self, key: str, lease_seconds: int) -> bool:
+        """
+        :return: whether this replica now holds key's lease, for lease_seconds at most
+        """
+
+    @abstractmethod
+    def release_lease(self, key: str):
+        pass
+
+    def wait_for(self, key: str, timeout: float, poll_interval: float = 0.1) -> Optional[Any]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = self.get(key)
+            if value is not None:
+                return value
+            time.sleep(poll_interval)
+        return None
+
+
+class SQLiteSharedCache(SharedCache):
+    """
+    Shared cache in a SQLite file, for replicas that share a volume.
+    """
+
+    def __init__(self, path: str, ttl: int = 300):
+        super().__init__(ttl)
+        self._path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+                               (key, time.time())).fetchone()
+        return self._loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                         (key, self._dumps(value), time.time() + self.ttl))
+
+    def acquire_lease(self, key: str, lease_seconds: int) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                                  (key, self._owner, now + lease_seconds))
+            return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner))
+
+
+class RedisSharedCache(SharedCache):
+    """
+    Shared cache in Redis. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str, ttl: int = 300):
+        super().__init__(ttl)
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        blob = self._redis.get('entry:' + key)
+        return self._loads(blob) if blob is not None else None
+
+    def set(self, key: str, value: Any):
+        self._redis.set('entry:' + key, self._dumps(value), ex=self.ttl)
+
+    def acquire_lease(self, key: str, lease_seconds: int) -> bool:
+        return bool(self._redis.set('lease:' + key, self._owner, nx=True, ex=lease_seconds))
+
+    def release_lease(self, key: str):
+        lease_key = 'lease:' + key
+        if self._redis.get(lease_key) == self._owner.encode():
+            self._redis.delete(lease_key)
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Build the shared cache named by SPRINT_DB_SHARED_CACHE: `redis://...` or `sqlite:///path/to/file.db`.
+    SPRINT_DB_SHARED_CACHE_TTL sets how long entries stay fresh, in seconds. Returns None when unset.
+    """
+    url = os.getenv('SPRINT_DB_SHARED_CACHE')
+    if not url:
+        return None
+    ttl = int(os.getenv('SPRINT_DB_SHARED_CACHE_TTL', '300'))
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisSharedCache(url, ttl=ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteSharedCache(url[len('sqlite:///'):], ttl=ttl)
+    raise ValueError(f'Unsupported SPRINT_DB_SHARED_CACHE: {url}')
@@ -1,23 +1,70 @@
+import time
 import plost
 import streamlit as st
+import numpy as np
 import pandas as pd
-from api_router import ApiRouter
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Tuple
+from api_router import ApiRouter, STATE_REVIEW
+from dates import parse_day
+from metrics_store import MetricsStore
+from router_pool import RouterPool
+from shared_cache import get_shared_cache
+from story_index import OwnerIndex
+from tenants import TenantRegistry
+from datetime import datetime, timezone, timedelta, date
+from typing import Dict, List, Optional, Tuple
 from utils import Utils
 
-r = ApiRouter()
-utils = Utils(r)
+
+@st.cache_resource
+def get_router_pool() -> RouterPool:
+    # Streamlit re-executes this script on every rerun: cache the pool so that every session and rerun
+    # in this process shares the same routers and their caches
+    return RouterPool(TenantRegistry.load(), shared_cache=get_shared_cache())
+
+
+@st.cache_resource
+def get_metrics_store() -> MetricsStore:
+    # Opened (and its table created) once per process rather than on every rerun
+    return MetricsStore()
+
+
+@st.cache_data(max_entries=64)
+def _render_table_html(df: pd.DataFrame, formatter_names: Tuple[Tuple[str, str], ...], _formatters: Dict) -> str:
+    # Cached by Streamlit on the table's content and which formatter each column goes through, so it is
+    # shared by every rerun and session of this process. The formatters themselves are not hashed
+    formatted = df.copy()
+    for col, formatter in _formatters.items():
+        formatted[col] = formatter(formatted[col])
+    return formatted.to_html(escape=False, na_rep='')
 
 
 class SprintDashboard:
-    def __init__(self):
-        self._current_iteration = None
-        self.general_one_off_improvements_epic = 3079
-        self.general_bugs_epic = 3078
+    _STATE_COLORS = {
+        'Ready for Development': '#F8860D',
+        'Completed': '#3BB546',
+        'In Review': '#3BB546',
+        'In Development': '#3BB546',
+    }
+
+    def __init__(self, r: ApiRouter, utils: Utils, iteration_name: Optional[str] = None,
+                 metrics_store: Optional[MetricsStore] = None):
+        self.r = r
+        self.utils = utils
+        self.metrics_store = metrics_store or MetricsStore()
+        self._current_iteration = iteration_name
+        self.general_one_off_improvements_epic = r.tenant.general_improvements_epic_id
+        self.general_bugs_epic = r.tenant.general_bugs_epic_id
         self.N_WEEKS_POST_DEPLOYMENT = 6
         self.N_WEEKS_NEEDS_ATTENTION = 15
-
+        self.N_SPRINTS_TREND = 12
+        # Closed sprints older than this are not snapshotted: their stories may no longer be loaded, and the
+        # change log that rolls workflow states back to the close only goes back change_retention_days
+        self.N_DAYS_SNAPSHOT = min(14, r.tenant.change_retention_days)
+        self.N_DAYS_FLOW = 90
+
+    @staticmethod
+    def set_page_config():
+        # Has to run before anything else is drawn on the page
         st.set_page_config(layout='wide', initial_sidebar_state='expanded')
         with open('style.css') as f:
             st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
@@ -26,17 +73,17 @@ class SprintDashboard:
         if m['completed_at_override'] is None:
             return False
         end_date = datetime.fromisoformat(m['completed_at_override'].replace('Z', '+00:00')).date()
-        self.weeks = utils.within_last_n_weeks(end_date, n=n_weeks)
+        self.weeks = self.utils.within_last_n_weeks(end_date, n=n_weeks)
         return self.weeks
 
     def get_story_completion_percentage(self, m: Dict) -> Tuple:
-        epics = r.get_epics_for_milestone(m['id'])
+        epics = self.r.get_epics_for_milestone(m['id'])
         completed_stories = sum(
-            [s['completed'] for e in epics for s in r.get_stories_for_epic(e['id']) if not s['archived']])
+            [s['completed'] for e in epics for s in self.r.get_stories_for_epic(e['id']) if not s['archived']])
         in_review_stories = sum(
-            [r.get_workflow(s['workflow_state_id']) == 'In Review' for e in epics for s in
-             r.get_stories_for_epic(e['id']) if not s['archived']])
-        total_stories = sum([not s['archived'] for e in epics for s in r.get_stories_for_epic(e['id'])])
+            [bool(self.r.get_state_class(s) & STATE_REVIEW) for e in epics for s in
+             self.r.get_stories_for_epic(e['id']) if not s['archived']])
+        total_stories = sum([not s['archived'] for e in epics for s in self.r.get_stories_for_epic(e['id'])])
         if total_stories == 0:
             return 0.0, 0.0
         return completed_stories / total_stories * 100, in_review_stories / total_stories * 100
@@ -47,16 +94,12 @@ class SprintDashboard:
             d = m.get('completed_at_override', None)
             if d is not None:
                 dt = datetime.fromisoformat(m.get('completed_at_override', '').replace('Z', '+00:00')).date()
-                if m.get('completed', '') is True and utils.within_last_n_weeks(dt, n=10):
+                if m.get('completed', '') is True and self.utils.within_last_n_weeks(dt, n=10):
                     recently_finished_milestones.append(m)
         return recently_finished_milestones
 
-    def show_sprint_stars(self, completed_stories_in_sprint: List[Dict]) -> List[str]:
-        user_count_map: Dict[str, int] = {}
-        for s in completed_stories_in_sprint:
-            for owner in s['owner_ids']:
-                owner_name = r.get_owner_name(owner)
-                user_count_map[owner_name] = user_count_map.get(owner_name, 0) + 1
+    def show_sprint_stars(self, owner_index: OwnerIndex) -> List[str]:
+        user_count_map = owner_index.get_completed_counts()
         # sort the map by value
         user_count_map = dict(sorted(user_count_map.items(), key=lambda x: -x[1]))
         stars = [f'<b>{key}</b>, for crushing {value} stories!' for key, value in user_count_map.items()]
@@ -67,10 +110,10 @@ class SprintDashboard:
         features = {}
 
         # Loop through all epics (for key milestones, and anything under gbai)
-        for epic in r.get_all_epics_in_current_sprint():
+        for epic in self.r.get_all_epics_in_current_sprint():
             epic_name = epic.get('name', '')
-            for s in utils.filter_all_but_unneeded_and_completed(
-                    r.get_stories_for_epic(epic['id'], sprint=self._current_iteration)):
+            for s in self.utils.filter_all_but_unneeded_and_completed(
+                    self.r.get_stories_for_epic(epic['id'], sprint=self._current_iteration)):
                 if s.get('story_type', '') in ['feature', 'chore']:
                     features[epic_name] = features.setdefault(epic_name, 0) + 1
                 elif s.get('story_type', '') == 'bug':
@@ -90,7 +133,7 @@ class SprintDashboard:
         for story in total_stories_in_sprint:
             workflow_id = story['workflow_state_id']
             if workflow_id is not None and workflow_id not in workflow_names:
-                workflow_names[workflow_id] = r.get_workflow(workflow_id)
+                workflow_names[workflow_id] = self.r.get_workflow(workflow_id)
 
         state_distributions = {}
         for workflow_id, workflow_name in workflow_names.items():
@@ -104,29 +147,197 @@ class SprintDashboard:
 
         return state_distributions
 
-    def create_dashboard(self):
-        if 'iteration_name' in st.session_state:
-            self._current_iteration = st.session_state['iteration_name']
-        key_milestones = list(r.get_milestones(active=True))
-        # Milestones in the 6-week time window
-        post_deployment_milestones = [x for x in r.get_milestones() if
-                                      self.has_ended_in_last_N_weeks(x, n_weeks=self.N_WEEKS_POST_DEPLOYMENT)]
+    def load_sprint_data(self) -> Dict:
+        """
+        Load the milestones and stories the dashboard is built from, for the current iteration.
+        Draws nothing, so it can also be used outside of Streamlit.
+        """
+        self.load_milestone_stories()
+        key_milestones = list(self.r.get_milestones(active=True))
         # "extended" means it includes the active milestones and the post deployment milestones
-        key_milestones_extended = key_milestones + post_deployment_milestones
-        all_milestones = key_milestones + [r.get_special_milestones()[1]]  # GBAI
-        gbai_stories = r.get_all_stories_for_milestone(milestone_id=3077, sprint=self._current_iteration)
+        key_milestones_extended = key_milestones + self.get_post_deployment_milestones()
+        all_milestones = key_milestones + [self.r.get_general_milestone()]  # GBAI
+        sprint_stories = self.get_sprint_stories(self._current_iteration, key_milestones_extended)
+        key_bugs, key_features = sprint_stories['key_bugs'], sprint_stories['key_features']
+        general_bugs, general_features = sprint_stories['general_bugs'], sprint_stories['general_features']
+
+        self.sync_burndown(key_bugs + key_features + general_bugs + general_features, key_milestones)
+        # Every loaded story is a duplicate candidate, not just the ones in this sprint
+        loaded_stories = self.r.get_loaded_stories()
+        self.utils.similarity.sync(loaded_stories)
+        self.utils.search.sync(loaded_stories)
+
+        return {
+            'key_milestones': key_milestones,
+            'key_milestones_extended': key_milestones_extended,
+            'all_milestones': all_milestones,
+            'key_stories': sprint_stories['key_stories'],
+            'key_bugs': key_bugs,
+            'key_features': key_features,
+            'general_bugs': general_bugs,
+            'general_features': general_features,
+            'owner_index': self.utils.get_owner_index({'key': key_bugs + key_features,
+                                                       'general': general_bugs + general_features}),
+            'milestone_forecasts': self.get_milestone_forecasts(key_milestones_extended),
+        }
+
+    def load_milestone_stories(self):
+        # Bulk-load epics and stories for every milestone the dashboard reads from
+        self.r.load_stories_for_milestones(
+            [m['id'] for m in self.r.get_milestones()] + [self.r.tenant.general_milestone_id])
+
+    def get_post_deployment_milestones(self) -> List[Dict]:
+        # Milestones in the 6-week time window
+        return [x for x in self.r.get_milestones() if
+                self.has_ended_in_last_N_weeks(x, n_weeks=self.N_WEEKS_POST_DEPLOYMENT)]
+
+    def get_sprint_stories(self, sprint_name: Optional[str], key_milestones_extended: List[Dict]) -> Dict[str, List]:
+        """
+        :return: the sprint's key stories, and its key / general bugs and features, without unneeded stories
+        """
+        gbai_stories = self.r.get_all_stories_for_milestone(milestone_id=self.r.tenant.general_milestone_id,
+                                                            sprint=sprint_name)
 
         key_stories = []
         for milestone in key_milestones_extended:
             key_stories.extend(
-                utils.filter_all_but_unneeded(r.get_all_stories_for_milestone(milestone['id'], sprint=self._current_iteration))
+                self.utils.filter_all_but_unneeded(self.r.get_all_stories_for_milestone(milestone['id'], sprint=sprint_name))
             )
 
-        general_bugs = utils.filter_bugs(utils.filter_all_but_unneeded(gbai_stories))
-        general_features = utils.filter_features(utils.filter_all_but_unneeded(gbai_stories))
+        return {
+            'key_stories': key_stories,
+            'key_bugs': self.utils.filter_bugs(self.utils.filter_all_but_unneeded(key_stories)),
+            'key_features': self.utils.filter_features(self.utils.filter_all_but_unneeded(key_stories)),
+            'general_bugs': self.utils.filter_bugs(self.utils.filter_all_but_unneeded(gbai_stories)),
+            'general_features': self.utils.filter_features(self.utils.filter_all_but_unneeded(gbai_stories)),
+        }
 
-        key_bugs = utils.filter_bugs(utils.filter_all_but_unneeded(key_stories))
-        key_features = utils.filter_features(utils.filter_all_but_unneeded(key_stories))
+    def run_checks(self):
+        """
+        Work that must not depend on anyone viewing a particular sprint: snapshot the sprints that closed and
+        run the alert rules. Run once per data refresh by the dashboard, and by report.py.
+        """
+        self.load_milestone_stories()
+        key_milestones_extended = list(self.r.get_milestones(active=True)) + self.get_post_deployment_milestones()
+        self.record_closed_sprint_snapshots(key_milestones_extended)
+        self.check_alerts(key_milestones_extended)
+
+    def get_milestone_forecasts(self, milestones: List[Dict]) -> Dict[int, Optional[Dict]]:
+        """
+        :return: milestone id -> Monte Carlo forecast of its remaining stories, see MilestoneForecaster.forecast
+        """
+        return {m['id']: self.utils.forecaster.forecast(m['id'], self.get_milestone_stories(m),
+                                                        started=parse_day(m.get('started_at_override')))
+                for m in milestones}
+
+    def get_milestone_stories(self, m: Dict) -> List[Dict]:
+        # Every story of the milestone that counts towards it, in or out of the sprint
+        return self.utils.filter_all_but_unneeded(
+            self.utils.filter_non_archived(self.r.get_all_stories_for_milestone(m['id'])))
+
+    @staticmethod
+    def _get_stories_version(stories: List[Dict]) -> int:
+        return hash(tuple((s['id'], s.get('updated_at')) for s in stories))
+
+    def check_alerts(self, milestones: List[Dict], today: Optional[date] = None):
+        """
+        Run the alert rules over the milestones and every sprint in progress whose stories changed since the
+        last check. Time-based facts move daily, so the day is part of every version.
+        """
+        today = today or datetime.now().date()
+        for m in milestones:
+            stories = self.get_milestone_stories(m)
+            version = (today, m.get('started_at_override'), m.get('completed_at_override'),
+                       self._get_stories_version(stories))
+            self.utils.alerts.sync('milestone', m['id'], version,
+                                   lambda m=m, stories=stories: self.get_milestone_health(m, stories))
+        for iteration in self.r.get_all_sprints():
+            if not date.fromisoformat(iteration['start_date']) <= today <= date.fromisoformat(iteration['end_date']):
+                continue
+            groups = self.get_sprint_stories(iteration['name'], milestones)
+            sprint_stories = (groups['key_bugs'] + groups['key_features'] +
+                              groups['general_bugs'] + groups['general_features'])
+            self.utils.alerts.sync('sprint', iteration['name'],
+                                   (today, self._get_stories_version(sprint_stories)),
+                                   lambda name=iteration['name'], stories=sprint_stories:
+                                   self.get_sprint_health(name, stories))
+
+    def get_milestone_health(self, m: Dict, stories: List[Dict]) -> Dict:
+        now = datetime.now(timezone.utc)
+        total = len(stories)
+        completed = sum(1 for s in stories if s.get('completed') is True)
+        facts = {
+            'name': m['name'],
+            'stories': total,
+            'remaining_stories': total - completed,
+            'completion_percent': completed / total * 100 if total else 0.0,
+            'elapsed_percent': None,
+            'days_to_sandbox': None,
+            'days_past_sandbox': None,
+        }
+        if m.get('started_at_override') and m.get('completed_at_override'):
+            start_date = datetime.fromisoformat(m['started_at_override'].replace('Z', '+00:00'))
+            end_date = datetime.fromisoformat(m['completed_at_override'].replace('Z', '+00:00'))
+            if end_date > start_date:
+                facts['elapsed_percent'] = ((now - start_date).total_seconds()
+                                            / (end_date - start_date).total_seconds() * 100)
+            # Same sandbox date as get_milestone_data_view
+            facts['days_to_sandbox'] = (end_date + timedelta(days=6) - now).days + 1
+            facts['days_past_sandbox'] = -facts['days_to_sandbox']
+        return facts
+
+    def get_sprint_health(self, sprint_name: str, sprint_stories: List[Dict]) -> Dict:
+        addressed = self.utils.filter_completed_and_in_review(sprint_stories)
+        return {
+            'name': sprint_name,
+            'stories': len(sprint_stories),
+            'triage_count': len(self.utils.filter_triage(sprint_stories)),
+            'completion_rate': self.utils.get_completion_rate(addressed, sprint_stories),
+            'remaining_stories': len(sprint_stories) - len(addressed),
+        }
+
+    def get_forecast_data_view(self, milestones: List[Dict], forecasts: Dict[int, Optional[Dict]]) -> Dict:
+        data = {"Milestone": [], "Remaining": [], "P50": [], "P85": [], "Dev Complete": []}
+        for m in milestones:
+            forecast = forecasts.get(m['id'])
+            data["Milestone"].append(f"{m['name']}###{m['app_url']}")
+            data["Remaining"].append(forecast['Remaining'] if forecast else None)
+            data["P50"].append(forecast['P50'].strftime('%b %d') if forecast and forecast['P50'] else '-')
+            data["P85"].append(forecast['P85'].strftime('%b %d') if forecast and forecast['P85'] else '-')
+            dev_complete = m.get('completed_at_override')
+            data["Dev Complete"].append(
+                datetime.fromisoformat(dev_complete.replace('Z', '+00:00')).strftime('%b %d') if dev_complete else '-')
+        return data
+
+    def sync_burndown(self, sprint_stories: List[Dict], milestones: List[Dict]):
+        # Only stories that changed since the last sync are re-applied to the series
+        if self._current_iteration is not None:
+            iteration = self.r.get_iteration_from_name(self._current_iteration)
+            self.utils.burndown.sync(('sprint', self._current_iteration),
+                                     date.fromisoformat(iteration['start_date']),
+                                     date.fromisoformat(iteration['end_date']),
+                                     sprint_stories)
+        for m in milestones:
+            if m.get('started_at_override') and m.get('completed_at_override'):
+                stories = self.get_milestone_stories(m)
+                self.utils.burndown.sync(('milestone', m['id']),
+                                         datetime.fromisoformat(m['started_at_override'].replace('Z', '+00:00')).date(),
+                                         datetime.fromisoformat(m['completed_at_override'].replace('Z', '+00:00')).date(),
+                                         stories)
+
+    def create_dashboard(self):
+        if 'iteration_name' in st.session_state:
+            self._current_iteration = st.session_state['iteration_name']
+        sprint_data = self.load_sprint_data()
+        key_milestones = sprint_data['key_milestones']
+        key_milestones_extended = sprint_data['key_milestones_extended']
+        all_milestones = sprint_data['all_milestones']
+        key_stories = sprint_data['key_stories']
+        key_bugs = sprint_data['key_bugs']
+        key_features = sprint_data['key_features']
+        general_bugs = sprint_data['general_bugs']
+        general_features = sprint_data['general_features']
+        owner_index = sprint_data['owner_index']
 
         all_bugs = key_bugs + general_bugs
         all_features = key_features + general_features
@@ -141,12 +352,14 @@ class SprintDashboard:
         )
 
         st.markdown("""---""")
+        self.show_changes()
 
-        tab1, tab2, tab3, tab4 = st.tabs(
-            ['Milestone Timelines', 'Milestones Details', 'Engineer Stories', 'Feature/Bug Distributions']
+        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+            ['Milestone Timelines', 'Milestones Details', 'Engineer Stories', 'Feature/Bug Distributions',
+             'Sprint Trends', 'Flow Metrics']
         )
 
-        self.populate_tab_1(key_milestones_extended, tab1)
+        self.populate_tab_1(key_milestones_extended, sprint_data['milestone_forecasts'], tab1)
         self.populate_tab_2(key_milestones, tab2)
 
         all_stories = key_bugs + key_features + general_bugs + general_features
@@ -161,6 +374,7 @@ class SprintDashboard:
             general_features,  # stories
             all_milestones,  # milestones
             all_stories,  # integer
+            owner_index,
             tab3
         )
         self.populate_tab_4(all_bugs,
@@ -170,7 +384,10 @@ class SprintDashboard:
                             all_stories,
                             key_bugs,
                             key_features,
+                            key_milestones,
                             tab4)
+        self.populate_tab_5(tab5)
+        self.populate_tab_6(tab6)
 
         # Create a container for the footer
         footer_container = st.container()
@@ -180,6 +397,168 @@ class SprintDashboard:
             st.write("---")
             st.write("<center>Built with ❤️ by Atin</center>", unsafe_allow_html=True)
 
+    def get_last_visit(self) -> Optional[float]:
+        # The previous visit's time travels in the URL, so it survives reloads. It is read once per session
+        # and then moved to now, for the next visit
+        if 'last_visit' not in st.session_state:
+            seen = st.query_params.get('seen')
+            st.session_state['last_visit'] = float(seen) if seen else None
+            st.query_params['seen'] = str(int(time.time()))
+        return st.session_state['last_visit']
+
+    def show_changes(self):
+        windows = {'Since last visit': self.get_last_visit(), 'Last hour': time.time() - 3600,
+                   'Last 24 hours': time.time() - 24 * 3600,
+                   f'Last {self.r.tenant.change_retention_days} days':
+                       time.time() - self.r.tenant.change_retention_days * 24 * 3600}
+        if windows['Since last visit'] is None:
+            del windows['Since last visit']
+        with st.expander('What Changed'):
+            window = st.selectbox('Changes:', list(windows.keys()))
+            changes = self.r.change_log.get_changes(since=windows[window])
+            st.markdown(f'###### {len(changes)} changes, tracked while the dashboard has been running')
+            if changes:
+                df = pd.DataFrame(self.get_changes_data_view(changes))
+                st.write(self.render_table_html(df, {'Story': self.make_clickable}), unsafe_allow_html=True)
+            st.markdown("""---""")
+
+    def get_changes_data_view(self, changes: List[Dict]) -> Dict:
+        data = {"When": [], "Story": [], "Change": []}
+        for change in reversed(changes):
+            data["When"].append(datetime.fromtimestamp(change['time']).strftime('%b %d, %H:%M'))
+            data["Story"].append(f"{change['name']}###{change['app_url']}")
+            if change['change'] == 'created':
+                description = f"New, {self.r.get_workflow(change['new'])}"
+            elif change['change'] == 'state':
+                description = f"{self.r.get_workflow(change['old'])} → {self.r.get_workflow(change['new'])}"
+            else:
+                old = ', '.join(filter(None, (self.r.get_members(o) for o in change['old']))) or 'Unassigned'
+                new = ', '.join(filter(None, (self.r.get_members(o) for o in change['new']))) or 'Unassigned'
+                description = f"Owner {old} → {new}"
+            data["Change"].append(description)
+        return data
+
+    def get_sprint_metrics(self, key_bugs, key_features, general_bugs, general_features, owner_index) -> Dict:
+        all_stories = key_bugs + key_features + general_bugs + general_features
+        addressed = self.utils.filter_completed_and_in_review(all_stories)
+        owner_count = owner_index.get_owner_count()
+        return {
+            'completion_rate': self.utils.get_completion_rate(addressed, all_stories),
+            'total': len(all_stories),
+            'done': len(addressed),
+            'remaining': len(all_stories) - len(addressed),
+            'bugs': len(key_bugs) + len(general_bugs),
+            'features': len(key_features) + len(general_features),
+            'owner_counts': dict(zip(owner_count['Owner'], owner_count['Stories'])),
+            'state_distribution': self.get_state_distribution(all_stories),
+        }
+
+    def record_closed_sprint_snapshots(self, key_milestones_extended: List[Dict], today: Optional[date] = None):
+        """
+        Snapshot every sprint that closed in the last N_DAYS_SNAPSHOT days and has no snapshot yet, with its
+        stories as they were at the end of its last day, so that trends keep the numbers at sprint close
+        rather than whatever the live data drifts to later.
+        """
+        today = today or datetime.now().date()
+        for iteration in self.r.get_all_sprints():
+            end_date = date.fromisoformat(iteration['end_date'])
+            if not today - timedelta(days=self.N_DAYS_SNAPSHOT) <= end_date < today:
+                continue
+            if self.metrics_store.has_snapshot(self.r.tenant.name, iteration['name']):
+                continue
+            closed_at = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc) + timedelta(days=1)
+            groups = {name: self.utils.get_stories_as_of(stories, closed_at) for name, stories in
+                      self.get_sprint_stories(iteration['name'], key_milestones_extended).items()}
+            owner_index = self.utils.get_owner_index({'key': groups['key_bugs'] + groups['key_features'],
+                                                      'general': groups['general_bugs'] + groups['general_features']})
+            self.metrics_store.save_snapshot(
+                self.r.tenant.name,
+                iteration['name'],
+                iteration['end_date'],
+                self.get_sprint_metrics(groups['key_bugs'], groups['key_features'], groups['general_bugs'],
+                                        groups['general_features'], owner_index)
+            )
+
+    def populate_tab_6(self, tab6):
+        with tab6:
+            st.markdown('## Flow Metrics')
+            st.markdown(f'###### Stories of the loaded milestones completed in the last {self.N_DAYS_FLOW} days. '
+                        f'Lead time: created to completed, cycle time: started to completed, in days')
+            frame = self.utils.flow.get_frame(self.utils.filter_non_archived(self.r.get_loaded_stories()))
+            completed = self.utils.flow.get_completed(frame, since=datetime.now(timezone.utc) - timedelta(days=self.N_DAYS_FLOW))
+            lead_p50, lead_p85 = self.utils.flow.get_overall_percentiles(completed, 'Lead Time')
+            cycle_p50, cycle_p85 = self.utils.flow.get_overall_percentiles(completed, 'Cycle Time')
+            col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
+            col2.metric("Completed", len(completed))
+            col3.metric("Lead Time P50", lead_p50)
+            col4.metric("Lead Time P85", lead_p85)
+            col5.metric("Cycle Time P50", cycle_p50)
+            col6.metric("Cycle Time P85", cycle_p85)
+            st.markdown("""---""")
+            c1, c2, c3 = st.columns((4.5, 1, 4.5))
+            with c1:
+                st.markdown('### Lead / Cycle Time')
+                group_by = st.selectbox('Group by:', ['Owner', 'Epic', 'Milestone', 'Type'])
+                table = self.utils.flow.get_percentiles(completed, group_by, ['Lead Time', 'Cycle Time'])
+                st.write(self.render_table_html(table, {}), unsafe_allow_html=True)
+            with c3:
+                st.markdown('### Waiting in Triage / In Review')
+                waiting = frame[frame['Days In State'].notna()]
+                st.write(self.render_table_html(self.utils.flow.get_percentiles(waiting, 'State', ['Days In State']), {}),
+                         unsafe_allow_html=True)
+                longest = waiting.sort_values('Days In State', ascending=False)[['Story', 'State', 'Owner', 'Days In State']]
+                st.write(self.render_table_html(longest.head(20).round(1).reset_index(drop=True),
+                                                {'Story': self.make_clickable}), unsafe_allow_html=True)
+
+    def populate_tab_5(self, tab5):
+        with tab5:
+            st.markdown('## Sprint Trends')
+            st.markdown('###### Metrics as recorded at the close of each sprint')
+            snapshots = self.metrics_store.get_snapshots(self.r.tenant.name, limit=self.N_SPRINTS_TREND)
+            if not snapshots:
+                st.write('No closed sprints have been recorded yet.')
+                return
+            sprint_names = [s['sprint_name'] for s in snapshots]
+            trend_df = pd.DataFrame({
+                'Sprint': sprint_names,
+                'Completion Rate': [s['completion_rate'] for s in snapshots],
+                'Done': [s['done'] for s in snapshots],
+                'Remaining': [s['remaining'] for s in snapshots],
+                'Bugs': [s['bugs'] for s in snapshots],
+                'Features': [s['features'] for s in snapshots],
+            })
+            c1, c2, c3 = st.columns((4.5, 1, 4.5))
+            with c1:
+                st.markdown('### Completion Rate')
+                plost.line_chart(
+                    data=trend_df,
+                    x='Sprint',
+                    y='Completion Rate',
+                    use_container_width=True,
+                )
+                st.markdown('### Done / Remaining')
+                plost.bar_chart(
+                    data=trend_df,
+                    bar='Sprint',
+                    value=['Done', 'Remaining'],
+                    use_container_width=True,
+                )
+            with c3:
+                st.markdown('### Bugs / Features')
+                plost.bar_chart(
+                    data=trend_df,
+                    bar='Sprint',
+                    value=['Bugs', 'Features'],
+                    use_container_width=True,
+                )
+            st.markdown("""---""")
+            st.markdown('### Stories per Owner')
+            owners_df = pd.DataFrame({s['sprint_name']: s['owner_counts'] for s in snapshots}).fillna(0).astype(int)
+            st.write(self.render_table_html(owners_df, {}), unsafe_allow_html=True)
+            st.markdown('### Stories by State')
+            states_df = pd.DataFrame({s['sprint_name']: s['state_distribution'] for s in snapshots}).fillna(0).astype(int)
+            st.write(self.render_table_html(states_df, {}), unsafe_allow_html=True)
+
     def populate_tab_4(self,
                        all_bugs,
                        all_features,
@@ -188,6 +567,7 @@ class SprintDashboard:
                        total_stories,
                        key_bugs,
                        key_features,
+                       key_milestones,
                        tab4):
         with tab4:
             st.markdown('## Feature / Bugs Distributions')
@@ -200,8 +580,8 @@ class SprintDashboard:
             bugs_percent = round(num_bugs / num_total * 100) if num_total != 0 else 0
             c2.metric("Features %", feature_percent, 1)
             c3.metric("Bugs %", bugs_percent, 1)
-            c4.metric("Features Closed", len(utils.filter_completed_and_in_review(all_features)))
-            c5.metric("Bugs Squashed", len(utils.filter_completed_and_in_review(all_bugs)))
+            c4.metric("Features Closed", len(self.utils.filter_completed_and_in_review(all_features)))
+            c5.metric("Bugs Squashed", len(self.utils.filter_completed_and_in_review(all_bugs)))
             st.markdown("""---""")
 
             # Row D
@@ -233,6 +613,8 @@ class SprintDashboard:
                     use_container_width=True,
                 )
             st.markdown("""---""")
+            self.draw_burndown_charts(key_milestones)
+            st.markdown("""---""")
             self.draw_feature_bug_distributions(
                 gen_bugs,
                 gen_features,
@@ -240,6 +622,33 @@ class SprintDashboard:
                 key_features
             )
 
+    def draw_burndown_charts(self, key_milestones):
+        today = datetime.now().date()
+        col1, col2, col3 = st.columns((4.5, 1, 4.5))
+        with col1:
+            st.markdown('### Sprint Burndown')
+            sprint_key = ('sprint', self._current_iteration)
+            if self.utils.burndown.has_series(sprint_key):
+                plost.line_chart(
+                    data=pd.DataFrame(self.utils.burndown.get_series(sprint_key, until=today)),
+                    x='Date',
+                    y=['Scope', 'Completed', 'Remaining'],
+                    use_container_width=True,
+                )
+        with col3:
+            st.markdown('### Milestone Burnup')
+            milestones = {m['name']: m['id'] for m in key_milestones
+                          if self.utils.burndown.has_series(('milestone', m['id']))}
+            if milestones:
+                milestone_name = st.selectbox('Milestone:', list(milestones.keys()))
+                plost.line_chart(
+                    data=pd.DataFrame(self.utils.burndown.get_series(('milestone', milestones[milestone_name]),
+                                                                     until=today)),
+                    x='Date',
+                    y=['Scope', 'Started', 'Completed'],
+                    use_container_width=True,
+                )
+
     def populate_tab_3(self,
                        key_bugs,
                        key_features,
@@ -247,78 +656,116 @@ class SprintDashboard:
                        general_features,
                        all_milestones,
                        total_stories,
+                       owner_index,
                        tab3):
-        # All stories in the current iteration
-        all_stories_in_sprint = key_bugs + key_features + general_bugs + general_features
         with tab3:
             # Row C
-            self.draw_ownership_count_charts(general_bugs,
-                                             general_features,
-                                             key_bugs + key_features,
-                                             all_milestones)
+            self.draw_ownership_count_charts(owner_index, all_milestones)
 
             st.markdown("""---""")
-            all_devs = r.get_all_members()
+            all_devs = self.r.get_all_members()
             col1, col2, col3 = st.columns((4.5, 1, 4.5))
             with col1:
                 st.markdown("### Member Stories")
                 all_devs = [s.strip() for s in all_devs]
                 team_member_name = st.selectbox('Team Member:', all_devs)
-                stories_by_member = utils.filter_stories_by_member(
-                    utils.filter_non_archived(all_stories_in_sprint),
-                    team_member_name.strip()
-                )
-                llm_member_summary = utils.get_llm_summary_for_stories(stories_by_member, team_member_name)
-                st.write(llm_member_summary)
+                stories_by_member = self.utils.filter_stories_by_member(owner_index, team_member_name.strip())
+                member_state_counts = owner_index.get_state_counts_for_member(team_member_name.strip())
+                st.write(', '.join(f'{count} {state}' for state, count in member_state_counts.items()))
+                summary_mode = None
+                if self.utils.use_llm_summary():
+                    summary_mode = 'local' if st.toggle('Quick summary (no LLM)', value=False) else None
+                summary_placeholder = st.empty()
+                llm_member_summary = ""
+                summary_stream = self.utils.stream_llm_summary_for_stories(stories_by_member, team_member_name,
+                                                                           mode=summary_mode)
+                try:
+                    for chunk in summary_stream:
+                        llm_member_summary += chunk
+                        summary_placeholder.write(llm_member_summary)
+                finally:
+                    # Stops reading the response if the script is rerun mid-stream
+                    summary_stream.close()
                 stories_by_member_df = pd.DataFrame(stories_by_member)
                 st.write(self.get_prettified_story_table(stories_by_member_df), unsafe_allow_html=True)
             with col3:
-                stars = self.show_sprint_stars(utils.filter_completed(total_stories))
+                stars = self.show_sprint_stars(owner_index)
                 st.markdown('### 🌮🌮 Sprint Tacos 🌮🌮')
                 for star in stars:
                     st.write(star, unsafe_allow_html=True)
             st.markdown("""---""")
             _, col2, _ = st.columns((2, 6, 2))
             with col2:
-                all_epics_in_sprint = utils.filter_all_but_done_epics(r.get_all_epics_in_current_sprint())
+                all_epics_in_sprint = self.utils.filter_all_but_done_epics(self.r.get_all_epics_in_current_sprint())
                 epic_names = set([e['name'] for e in all_epics_in_sprint])
                 st.markdown('### Active Epics')
                 epic_name = st.selectbox('Shows In Progress & Unstarted Stories:', epic_names)
 
-                stories_by_epic = utils.filter_stories_by_epic(
-                    # utils.filter_in_review_and_ready_for_development(total_stories),
-                    utils.filter_all_but_unneeded_and_completed(total_stories),
-                    epic_name.strip()
+                stories_by_epic = self.utils.filter_stories_by_epic(
+                    # self.utils.filter_in_review_and_ready_for_development(total_stories),
+                    self.utils.group_stories_by_epic(self.utils.filter_all_but_unneeded_and_completed(total_stories)),
+                    self.r.get_epic_ids_for_name(epic_name.strip())
                 )
                 stories_by_epic_df = pd.DataFrame(stories_by_epic)
                 st.write(self.get_prettified_story_table(stories_by_epic_df), unsafe_allow_html=True)
+            st.markdown("""---""")
+            _, col2, _ = st.columns((2, 6, 2))
+            with col2:
+                st.markdown('### Story Search')
+                query = st.text_input('Search names, descriptions and labels:',
+                                      help='All words must match. Use OR for alternatives, -word to exclude, '
+                                           'word* for prefixes.')
+                if query.strip():
+                    results = self.utils.search.search(query)
+                    st.write(f'{len(results)} stories')
+                    if results:
+                        results_df = pd.DataFrame(self.utils.get_story_table_data(results))
+                        st.write(self.get_prettified_story_table(results_df, sort_by_date=False),
+                                 unsafe_allow_html=True)
+            st.markdown("""---""")
+            _, col2, _ = st.columns((2, 6, 2))
+            with col2:
+                st.markdown('### Possible Duplicates')
+                st.markdown('###### Stories in Triage with similar loaded stories')
+                duplicates_df = pd.DataFrame(self.utils.get_possible_duplicates_table(self.utils.filter_triage(total_stories)))
+                st.write(self.render_table_html(duplicates_df, {'Story': self.make_clickable}), unsafe_allow_html=True)
 
-    def get_prettified_story_table(self, stories_for_epic_df):
+    def get_prettified_story_table(self, stories_for_epic_df, sort_by_date: bool = True):
         # TODO: Replace ID column with the Story ID
-        stories_for_epic_df = self.sort_by_date(stories_for_epic_df)
+        if sort_by_date:
+            stories_for_epic_df = self.sort_by_date(stories_for_epic_df)
         stories_for_epic_df.reset_index(drop=True, inplace=True)
-        stories_for_epic_df = stories_for_epic_df.style.format(
-            {'Story': self.make_clickable, 'State': self.color_green_completed})
-        story_table = stories_for_epic_df.to_html()
-        return story_table
-
-    def sort_by_date(self, stories_for_epic_df):
-        stories_for_epic_df['Temp_Date'] = pd.to_datetime(stories_for_epic_df['Created'])
-        stories_for_epic_df = stories_for_epic_df.sort_values(by='Temp_Date', ascending=False)
-        stories_for_epic_df = stories_for_epic_df.drop(columns="Temp_Date", axis=1)
-        return stories_for_epic_df
+        return self.render_table_html(stories_for_epic_df, {'Story': self.make_clickable,
+                                                            'State': self.color_green_completed})
+
+    def sort_by_date(self, stories_for_epic_df, column='Created', ascending=False):
+        # Reorder by the parsed dates directly instead of round-tripping through a temp column
+        order = pd.to_datetime(stories_for_epic_df[column]).sort_values(ascending=ascending, kind='stable').index
+        return stories_for_epic_df.loc[order]
+
+    def render_table_html(self, df, formatters: Dict) -> str:
+        """
+        Render a DataFrame to HTML, formatting whole columns at once instead of going through
+        Styler's per-cell callbacks. Rendered tables are cached by content hash.
+        :param df: table to render
+        :param formatters: column name -> vectorized formatter taking and returning a Series
+        :return: html table
+        """
+        formatters = {col: f for col, f in formatters.items() if col in df.columns and not df.empty}
+        formatter_names = tuple(sorted((col, f.__name__) for col, f in formatters.items()))
+        return _render_table_html(df, formatter_names, formatters)
 
     # Define a function to apply background color to cells
-    def color_green_completed(self, val):
-        if val == 'Ready for Development':
-            color = '#F8860D'
-        else:
-            color = '#3BB546' if val in {'Completed', 'In Review', 'In Development'} else '#000000'
-        return f"<font size='7px' color='{color}'><b>{val}</b></font>" if color != '#000000' else val
+    def color_green_completed(self, vals: pd.Series) -> pd.Series:
+        colors = vals.map(self._STATE_COLORS)
+        colored = "<font size='7px' color='" + colors + "'><b>" + vals.astype(str) + "</b></font>"
+        return colored.where(colors.notna(), vals)
 
-    def color_red_negative_completed(self, val):
-        color = '#FF0000' if int(val) <= 0 else '#F8860D' if 1 <= int(val) <= 10 else '#3BB546'
-        return f"<font size='7px' color='{color}'><b>{val}</b></font>"
+    def color_red_negative_completed(self, vals: pd.Series) -> pd.Series:
+        days = pd.to_numeric(vals)
+        colors = pd.Series(np.select([days <= 0, days <= 10], ['#FF0000', '#F8860D'], '#3BB546'), index=vals.index)
+        colored = "<font size='7px' color='" + colors + "'><b>" + days.astype('Int64').astype(str) + "</b></font>"
+        return colored.where(days.notna(), None)
 
     def populate_tab_2(self, key_milestones, tab2):
         with tab2:
@@ -328,43 +775,48 @@ class SprintDashboard:
                 st.markdown("### Active Milestones")
                 st.markdown("The <b>Days Remaining</b> below signifies the days to <b>launch to Sandbox</b>.", unsafe_allow_html=True)
                 df = pd.DataFrame(self.get_milestone_data_view(key_milestones))
-                df['Dev Complete Date'] = pd.to_datetime(df['Dev Complete Date'])
-                df.sort_values(by='Dev Complete Date', ascending=True, inplace=True)
+                df = self.sort_by_date(df, column='Dev Complete Date', ascending=True)
                 df.drop(columns=['Dev Complete Date'], inplace=True)
-                df = df.style.format({'Milestone': self.make_clickable,
-                                      'Days Remaining': self.color_red_negative_completed})
-                table = df.to_html()
+                table = self.render_table_html(df, {'Milestone': self.make_clickable,
+                                                    'Days Remaining': self.color_red_negative_completed})
                 st.write(table, unsafe_allow_html=True)
                 st.markdown("""---""")
-                self.post_deployment_milestones(key_milestones)
+                post_deployment_df, needs_attention_df = self.get_past_milestones(
+                    key_milestones, [self.N_WEEKS_POST_DEPLOYMENT, self.N_WEEKS_NEEDS_ATTENTION])
+                self.post_deployment_milestones(post_deployment_df)
                 st.markdown("""---""")
-                self.milestones_needing_attention(key_milestones)
+                self.milestones_needing_attention(needs_attention_df)
 
-    def populate_tab_1(self, key_milestones: List, tab1):
+    def populate_tab_1(self, key_milestones: List, milestone_forecasts: Dict, tab1):
         with tab1:
             st.markdown('### Key Milestone Timelines')
             c1, c2 = st.columns((7, 3))
             with c1:
                 self.draw_eta_visualization(key_milestones)
+            with c2:
+                st.markdown('#### Forecast')
+                st.markdown('###### P50 / P85 completion, simulated from recent weekly throughput')
+                df = pd.DataFrame(self.get_forecast_data_view(key_milestones, milestone_forecasts))
+                st.write(self.render_table_html(df, {'Milestone': self.make_clickable}), unsafe_allow_html=True)
 
     def populate_top_sprint_metrics(self, key_milestones, key_bugs, key_features,
                                     general_bugs, general_features, key_stories):
         general_stories = general_bugs + general_features
         key_stories = key_bugs + key_features
-        triage_key = utils.filter_triage(key_stories)
-        addressed_key = utils.filter_completed_and_in_review(key_stories)
-        triage_general = utils.filter_triage(general_bugs + general_features)
-        addressed_general = utils.filter_completed_and_in_review(general_bugs + general_features)
+        triage_key = self.utils.filter_triage(key_stories)
+        addressed_key = self.utils.filter_completed_and_in_review(key_stories)
+        triage_general = self.utils.filter_triage(general_bugs + general_features)
+        addressed_general = self.utils.filter_completed_and_in_review(general_bugs + general_features)
 
         st.markdown('### Galileo: Sprint Metrics')
-        completion_rate = utils.get_completion_rate(addressed_key + addressed_general, key_stories + general_stories)
+        completion_rate = self.utils.get_completion_rate(addressed_key + addressed_general, key_stories + general_stories)
         st.write(f'Completion Rate: <b>{completion_rate}%</b>', unsafe_allow_html=True)
         st.markdown("""---""")
 
-        key_stories_complete = len(utils.filter_completed_and_in_review(key_features))
-        key_bugs_complete = len(utils.filter_completed_and_in_review(key_bugs))
-        general_features_complete = len(utils.filter_completed_and_in_review(general_features))
-        general_bugs_complete = len(utils.filter_completed_and_in_review(general_bugs))
+        key_stories_complete = len(self.utils.filter_completed_and_in_review(key_features))
+        key_bugs_complete = len(self.utils.filter_completed_and_in_review(key_bugs))
+        general_features_complete = len(self.utils.filter_completed_and_in_review(general_features))
+        general_bugs_complete = len(self.utils.filter_completed_and_in_review(general_bugs))
 
         # Row 1
         col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
@@ -403,7 +855,7 @@ class SprintDashboard:
         with c1:
             st.markdown('#### Key Milestone Stories')
             st.markdown('###### Includes Completed stories')
-            status_map = r.get_status_count(key_bugs + key_features)
+            status_map = self.r.get_status_count(key_bugs + key_features)
             status_map = {
                 'Status': status_map.keys(),
                 'Stories': status_map.values()
@@ -428,15 +880,13 @@ class SprintDashboard:
             )
 
     def draw_ownership_count_charts(self,
-                                    general_bugs,
-                                    general_features,
-                                    key_stories,
+                                    owner_index,
                                     all_active_milestones):
         c1, c2, c3 = st.columns((4.5, 1, 4.5))
         with c1:
             st.markdown('### Key Milestone Stories')
             st.markdown('###### Includes In-progress, Unstarted & Completed stories')
-            owner_map = r.get_owner_count(key_stories)
+            owner_map = owner_index.get_owner_count(groups=['key'])
             plost.bar_chart(
                 data=pd.DataFrame(owner_map),
                 bar='Owner',
@@ -450,8 +900,9 @@ class SprintDashboard:
             # general bugs
             st.markdown('### General Bugs & Features')
             st.markdown('###### Includes In-progress, Unstarted & Completed stories')
-            general_bug_owners = r.get_owner_count(general_bugs)
-            general_improvements_owners = r.get_owner_count(general_features)
+            general_bug_owners = owner_index.get_owner_count(groups=['general'], story_types=['bug'])
+            general_improvements_owners = owner_index.get_owner_count(groups=['general'],
+                                                                      story_types=['feature', 'chore'])
 
             bug_owners_df = pd.DataFrame(general_bug_owners)
             improvement_owners_df = pd.DataFrame(general_improvements_owners)
@@ -475,7 +926,7 @@ class SprintDashboard:
             # Grouped Bar of Features & Bugs - by Epics
             all_active_epics = []
             for m in all_active_milestones:
-                all_active_epics.extend(r.get_epics_for_milestone(m['id']))
+                all_active_epics.extend(self.r.get_epics_for_milestone(m['id']))
             epic_story_count_map = self.get_epic_story_counts()
             plost.bar_chart(
                 data=pd.DataFrame(epic_story_count_map),
@@ -519,62 +970,64 @@ class SprintDashboard:
                             </div>
                         """, unsafe_allow_html=True)
 
-    def post_deployment_milestones(self, active_milestones):
+    def post_deployment_milestones(self, df):
         st.markdown('### Milestones in Post Deployment')
         st.markdown(f'<b>Should be in Sandbox</b>, <b>launched to customers</b>, '
                     f'in the {self.N_WEEKS_POST_DEPLOYMENT}-week phase of fixing bugs arising via customer usage.',
                     unsafe_allow_html=True)
-        df = self.get_past_milestones(active_milestones, n_weeks=self.N_WEEKS_POST_DEPLOYMENT)
-        df['Dev Complete Date'] = pd.to_datetime(df['Dev Complete Date'])
-        df.sort_values(by='Dev Complete Date', ascending=True, inplace=True)
+        df = self.sort_by_date(df, column='Dev Complete Date', ascending=True)
         df.drop(columns=['Dev Complete Date'], inplace=True)
-        df = df.style.format({'Milestone': self.make_clickable, 'Days Remaining': self.color_red_negative_completed})
-        df_html = df.to_html()
+        df_html = self.render_table_html(df, {'Milestone': self.make_clickable,
+                                              'Days Remaining': self.color_red_negative_completed})
         st.write(df_html, unsafe_allow_html=True)
 
-    def milestones_needing_attention(self, active_milestones):
+    def milestones_needing_attention(self, df):
         st.markdown('### Milestones Needing Attention')
         st.markdown(f'<b>Concern Zone</b>: Between {self.N_WEEKS_POST_DEPLOYMENT} and {self.N_WEEKS_NEEDS_ATTENTION} weeks '
                     'from Sandbox/Customer Launch', unsafe_allow_html=True)
-        df1 = self.get_past_milestones(active_milestones, n_weeks=self.N_WEEKS_NEEDS_ATTENTION)
-        df2 = self.get_past_milestones(active_milestones, n_weeks=self.N_WEEKS_POST_DEPLOYMENT)
-        # merge the two dataframes on all columns
-        merged = df1.merge(df2, how='outer', indicator=True)
-        # filter the rows that are only in df1
-        filtered = merged[merged['_merge'] == 'left_only'][df1.columns]
-        filtered['Dev Complete Date'] = pd.to_datetime(filtered['Dev Complete Date'])
-        filtered.sort_values(by='Dev Complete Date', ascending=True, inplace=True)
-        filtered.drop(columns=['Dev Complete Date'], inplace=True)
-
-        filtered = filtered.style.format({'Milestone': self.make_clickable, 'State': self.color_green_completed})
-        filtered_html = filtered.to_html()
-        st.write(filtered_html, unsafe_allow_html=True)
-
-    def get_past_milestones(self, active_milestones, n_weeks):
+        df = self.sort_by_date(df, column='Dev Complete Date', ascending=True)
+        df.drop(columns=['Dev Complete Date'], inplace=True)
+
+        df_html = self.render_table_html(df, {'Milestone': self.make_clickable,
+                                              'State': self.color_green_completed})
+        st.write(df_html, unsafe_allow_html=True)
+
+    def get_past_milestones(self, active_milestones, n_weeks_bands: List[int]) -> List[pd.DataFrame]:
+        """
+        Non-active milestones that ended in the past and are at most 95% complete, split into bands by how
+        many weeks ago they ended. Band i covers milestones that ended between n_weeks_bands[i - 1] and
+        n_weeks_bands[i] weeks ago (band 0 starts today).
+        :param active_milestones: milestones to leave out
+        :param n_weeks_bands: band edges in weeks, ascending
+        :return: one milestone data view per band
+        """
         active_ms_set = set()
         for am in active_milestones:
             active_ms_set.add(am['id'])
+        today = datetime.now().date()
+        band_starts = [(datetime.now() - timedelta(weeks=n)).date() for n in n_weeks_bands]
         # milestones that have passed the dates,
-        problematic_milestones = []
-        problematic_completion_percent = []
-        problematic_in_review_percent = []
-        all_milestones = list(r.get_milestones())
-        for m in all_milestones:
-            cp_tuple = self.get_story_completion_percentage(m)
-            if m['id'] not in active_ms_set and self.has_ended_in_last_N_weeks(m, n_weeks=n_weeks) and cp_tuple[
-                0] <= 95:
-                problematic_milestones.append(m)
-                problematic_completion_percent.append("{}%".format(str(round(cp_tuple[0], 2))))
-                problematic_in_review_percent.append("{}%".format(str(round(cp_tuple[1], 2))))
-        # list of non active milestones
-        pdf = pd.DataFrame(self.get_milestone_data_view(problematic_milestones))
-        return pdf
-
-    def make_clickable(self, val):
-        split_val = val.split('###')
-        return "<a href={} target='_blank'>{}</a>".format(split_val[1], split_val[0])
-
-    def get_milestone_data_view(self, milestones):
+        past_milestone_views = []
+        for band in self.r.get_milestones_by_completion_band(band_starts, until=today):
+            problematic_milestones = []
+            completion_percentages = {}
+            for m in band:
+                if m['id'] in active_ms_set:
+                    continue
+                cp_tuple = self.get_story_completion_percentage(m)
+                if cp_tuple[0] <= 95:
+                    problematic_milestones.append(m)
+                    completion_percentages[m['id']] = cp_tuple
+            # list of non active milestones
+            past_milestone_views.append(
+                pd.DataFrame(self.get_milestone_data_view(problematic_milestones, completion_percentages)))
+        return past_milestone_views
+
+    def make_clickable(self, vals: pd.Series) -> pd.Series:
+        split_vals = vals.str.split('###', n=1, expand=True).reindex(columns=[0, 1])
+        return "<a href=" + split_vals[1] + " target='_blank'>" + split_vals[0] + "</a>"
+
+    def get_milestone_data_view(self, milestones, completion_percentages: Optional[Dict[int, Tuple]] = None):
         milestone_names = []
         started_dates = []
         dev_complete_dates = []
@@ -590,11 +1043,11 @@ class SprintDashboard:
 
         for milestone in milestones:
             milestone_names.append(milestone['name'] + "###" + milestone['app_url'])
-            epics = r.get_epics_for_milestone(milestone['id'])
+            epics = self.r.get_epics_for_milestone(milestone['id'])
             num_epics.append(len(epics))
             total_stories = 0
             for e in epics:
-                stories = r.get_stories_for_epic(e['id'])
+                stories = self.r.get_stories_for_epic(e['id'])
                 total_stories += len(stories)
 
             num_stories.append(total_stories)
@@ -628,7 +1081,10 @@ class SprintDashboard:
             if (started_date is None) or (started_date is None and sandbox_date is None):
                 days_elapsed.append(0)
 
-            cp_tuple = self.get_story_completion_percentage(milestone)
+            if completion_percentages is not None and milestone['id'] in completion_percentages:
+                cp_tuple = completion_percentages[milestone['id']]
+            else:
+                cp_tuple = self.get_story_completion_percentage(milestone)
             problematic_completion_percent.append("{}%".format(str(round(cp_tuple[0], 2))))
             problematic_in_review_percent.append("{}%".format(str(round(cp_tuple[1], 2))))
 
@@ -650,7 +1106,7 @@ class SprintDashboard:
         return data
 
     def new_bugs_features_grouped_by_day(self, stories):
-        stories = utils.filter_stories_by_sprint(stories, self._current_iteration)
+        stories = self.utils.filter_stories_by_sprint(stories, self._current_iteration)
         bugs = {}
         features = {}
         for s in stories:
@@ -658,9 +1114,9 @@ class SprintDashboard:
             if creation_day != '':
                 date_object = datetime.strptime(creation_day, '%Y-%m-%dT%H:%M:%SZ')
                 date_str = date_object.strftime('%Y-%m-%d')
-                if utils.is_feature_or_chore(s):
+                if self.utils.is_feature_or_chore(s):
                     features[date_str] = features.setdefault(date_str, 0) + 1
-                elif utils.is_bug(s):
+                elif self.utils.is_bug(s):
                     bugs[date_str] = bugs.setdefault(date_str, 0) + 1
         bugs = dict(sorted(bugs.items(), key=lambda x: x[0]))
         features = dict(sorted(features.items(), key=lambda x: x[0]))
@@ -673,11 +1129,19 @@ class SprintDashboard:
 
 
 def main():
-    sdb = SprintDashboard()
+    SprintDashboard.set_page_config()
+    router_pool = get_router_pool()
+    tenant_names = router_pool.tenant_names()
+    st.sidebar.header('Sprint Dashboard')
+    tenant_name = tenant_names[0] if len(tenant_names) == 1 else st.sidebar.selectbox('Team:', tenant_names)
+    r, utils = router_pool.get(tenant_name)
+    r.refresh_if_stale()
+    sdb = SprintDashboard(r, utils, metrics_store=get_metrics_store())
+    if utils.claim_checks(r.generation):
+        sdb.run_checks()
     sprints = r.get_all_sprints()
     recent_sprints = utils.filter_recent_sprints(sprints)
     sprints = [name for name, e_date in sorted(recent_sprints, key=lambda x: x[1], reverse=True)]
-    st.sidebar.header('Sprint Dashboard')
     st.session_state['iteration_name'] = st.sidebar.selectbox('Sprint Name:', tuple(sprints))
     sdb.create_dashboard()
 
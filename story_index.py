@@ -0,0 +1,318 @@
+import re
+import math
+import bisect
+import threading
+import numpy as np
+import scipy.sparse as sp
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Iterable, Tuple
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from api_router import ApiRouter
+
+
+class OwnerIndex:
+    """
+    owner_id -> story IDs over a sprint's stories, with per-owner sub-counts by story type and workflow state.
+    Stories are indexed in named groups (e.g. key milestone vs general stories) so that the ownership charts
+    can be read per group. Member tables, sprint stars and ownership charts become lookups into this index
+    instead of full scans of the sprint.
+    """
+
+    def __init__(self, r: ApiRouter, groups: Dict[str, List[Dict]]):
+        self._r = r
+        self._stories: Dict[int, Dict] = {}
+        # story id -> position in the indexed stories, to return lookups in their original order
+        self._position: Dict[int, int] = {}
+        # any owner -> story ids
+        self._stories_by_owner: Dict[str, List[int]] = defaultdict(list)
+        # any owner -> number of completed stories
+        self._completed_counts: Counter = Counter()
+        # primary owner -> (group, story type) / (group, state name) -> number of stories
+        self._type_counts: Dict[str, Counter] = defaultdict(Counter)
+        self._state_counts: Dict[str, Counter] = defaultdict(Counter)
+        self._owner_names: Dict[str, Optional[str]] = {}
+
+        for group, stories in groups.items():
+            for story in stories:
+                self._add(group, story)
+
+    def _add(self, group: str, story: Dict):
+        story_id = story['id']
+        self._position.setdefault(story_id, len(self._position))
+        self._stories[story_id] = story
+        for owner_id in story['owner_ids']:
+            self._stories_by_owner[owner_id].append(story_id)
+            if story.get('completed', '') is True:
+                self._completed_counts[owner_id] += 1
+        if story['owner_ids']:
+            primary_owner_id = story['owner_ids'][0]
+            self._type_counts[primary_owner_id][(group, story['story_type'])] += 1
+            self._state_counts[primary_owner_id][(group, self._r.get_workflow(story['workflow_state_id']))] += 1
+
+    def _owner_name(self, owner_id: str) -> Optional[str]:
+        if owner_id not in self._owner_names:
+            self._owner_names[owner_id] = self._r.get_owner_name(owner_id)
+        return self._owner_names[owner_id]
+
+    def _owner_ids_for_member(self, member_name: str) -> List[str]:
+        return [owner_id for owner_id in self._stories_by_owner
+                if self._owner_name(owner_id) is not None
+                and self._owner_name(owner_id).replace("\\", "") == member_name]
+
+    def get_stories_for_member(self, member_name: str, include_archived: bool = False) -> List[Dict]:
+        story_ids = {story_id for owner_id in self._owner_ids_for_member(member_name)
+                     for story_id in self._stories_by_owner[owner_id]}
+        stories = [self._stories[story_id] for story_id in sorted(story_ids, key=self._position.get)]
+        if include_archived:
+            return stories
+        return [s for s in stories if s.get('archived', False) is not True]
+
+    def get_state_counts_for_member(self, member_name: str) -> Dict[str, int]:
+        state_counts: Counter = Counter()
+        for owner_id in self._owner_ids_for_member(member_name):
+            for (_, state), count in self._state_counts[owner_id].items():
+                state_counts[state] += count
+        return dict(state_counts)
+
+    def get_completed_counts(self) -> Dict[str, int]:
+        """
+        :return: owner name -> completed stories, counting every owner of a story
+        """
+        completed_counts: Dict[str, int] = {}
+        for owner_id, count in self._completed_counts.items():
+            owner_name = self._owner_name(owner_id)
+            completed_counts[owner_name] = completed_counts.get(owner_name, 0) + count
+        return completed_counts
+
+    def get_owner_count(self, groups: Optional[Iterable[str]] = None,
+                        story_types: Optional[Iterable[str]] = None) -> Dict[str, List]:
+        """
+        Stories per primary owner, in the same shape as ApiRouter.get_owner_count.
+        :param groups: only count these groups, defaults to all
+        :param story_types: only count these story types, defaults to all
+        """
+        groups = set(groups) if groups is not None else None
+        story_types = set(story_types) if story_types is not None else None
+        owner_count: Dict[str, int] = {}
+        for owner_id, type_counts in self._type_counts.items():
+            count = sum(c for (group, story_type), c in type_counts.items()
+                        if (groups is None or group in groups) and (story_types is None or story_type in story_types))
+            if count:
+                owner_name = self._owner_name(owner_id)
+                owner_count[owner_name] = owner_count.get(owner_name, 0) + count
+        return {
+            'Owner': list(owner_count.keys()),
+            'Stories': list(owner_count.values())
+        }
+
+
+class SimilarityIndex:
+    """
+    TF-IDF index over story names and descriptions for "possible duplicate" lookups by cosine similarity.
+    Term counts come from a stateless HashingVectorizer and document frequencies are maintained alongside
+    them, so a sync only vectorizes the stories that changed; nothing is refit per render. The weighted
+    matrix is rebuilt lazily on the first query after a sync changed something.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18):
+        self._vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None,
+                                             stop_words='english')
+        self._n_features = n_features
+        # story id -> (version, term indices, term counts)
+        self._rows: Dict[int, Tuple[Optional[str], np.ndarray, np.ndarray]] = {}
+        self._doc_freq = np.zeros(n_features, dtype=np.int64)
+        # (weighted matrix, story id of each row), replaced as a whole
+        self._matrix: Optional[Tuple[sp.csr_matrix, List[int]]] = None
+        # Guards _rows, _doc_freq and _matrix
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _text(story: Dict) -> str:
+        return f"{story.get('name', '')} {story.get('description', '') or ''}"
+
+    def sync(self, stories: Iterable[Dict]) -> int:
+        """
+        :return: number of stories that were (re)vectorized
+        """
+        with self._lock:
+            changed = [s for s in stories
+                       if s['id'] not in self._rows or self._rows[s['id']][0] != s.get('updated_at')]
+            if not changed:
+                return 0
+            replaced = [self._rows[s['id']][1] for s in changed if s['id'] in self._rows]
+            if replaced:
+                self._doc_freq -= np.bincount(np.concatenate(replaced), minlength=self._n_features)
+            counts = self._vectorizer.transform([self._text(s) for s in changed]).tocsr()
+            counts.sum_duplicates()
+            self._doc_freq += np.bincount(counts.indices, minlength=self._n_features)
+            for i, story in enumerate(changed):
+                row = slice(counts.indptr[i], counts.indptr[i + 1])
+                self._rows[story['id']] = (story.get('updated_at'), counts.indices[row], counts.data[row])
+            self._matrix = None
+            return len(changed)
+
+    def _idf(self) -> np.ndarray:
+        n = len(self._rows)
+        return np.log((1 + n) / (1 + self._doc_freq)) + 1
+
+    def _weighted(self, counts: sp.csr_matrix) -> sp.csr_matrix:
+        return normalize(counts.multiply(self._idf()).tocsr())
+
+    def _to_csr(self, story_ids: List[int]) -> sp.csr_matrix:
+        rows = [self._rows[sid] for sid in story_ids]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(r[1]) for r in rows], out=indptr[1:])
+        indices = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0, dtype=np.int32)
+        data = np.concatenate([r[2] for r in rows]) if rows else np.zeros(0)
+        return sp.csr_matrix((data, indices, indptr), shape=(len(rows), self._n_features))
+
+    def _get_matrix(self) -> Tuple[sp.csr_matrix, List[int]]:
+        # Called with the lock held
+        if self._matrix is None:
+            matrix_ids = list(self._rows.keys())
+            self._matrix = (self._weighted(self._to_csr(matrix_ids)), matrix_ids)
+        return self._matrix
+
+    @staticmethod
+    def _nearest(query: sp.csr_matrix, matrix: sp.csr_matrix, matrix_ids: List[int], k: int, min_score: float,
+                 exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        if matrix.shape[0] == 0:
+            return []
+        scores = (matrix @ query.T).toarray().ravel()
+        n = min(k + 1, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(matrix_ids[i], float(scores[i])) for i in top
+                if matrix_ids[i] != exclude and scores[i] >= min_score][:k]
+
+    def get_similar_stories(self, story_id: int, k: int = 3, min_score: float = 0.5) -> List[Tuple[int, float]]:
+        """
+        :return: (story id, cosine similarity) of the most similar other stories, best first
+        """
+        with self._lock:
+            if story_id not in self._rows:
+                return []
+            query = self._weighted(self._to_csr([story_id]))
+            matrix, matrix_ids = self._get_matrix()
+        return self._nearest(query, matrix, matrix_ids, k, min_score, exclude=story_id)
+
+    def search(self, text: str, k: int = 10, min_score: float = 0.1) -> List[Tuple[int, float]]:
+        """
+        :return: (story id, cosine similarity) of the stories most similar to free text, best first
+        """
+        counts = self._vectorizer.transform([text]).tocsr()
+        with self._lock:
+            query = self._weighted(counts)
+            matrix, matrix_ids = self._get_matrix()
+        return self._nearest(query, matrix, matrix_ids, k, min_score)
+
+
+class SearchIndex:
+    """
+    Inverted index over story names, descriptions and labels for the story search box. Stories are
+    (re)indexed on sync only when their `updated_at` changed. Queries are space separated terms that all
+    have to match; `OR` between groups of terms matches either group, `-term` excludes and `term*` matches
+    any term with that prefix. Results are ranked by TF-IDF, with name terms weighted above the rest.
+    """
+
+    _TOKEN = re.compile(r'[a-z0-9]+')
+
+    def __init__(self, name_weight: int = 3):
+        self.name_weight = name_weight
+        self._stories: Dict[int, Dict] = {}
+        # story id -> (version, term frequencies)
+        self._docs: Dict[int, Tuple[Optional[str], Counter]] = {}
+        # term -> story id -> term frequency
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # Sorted terms, for prefix lookups
+        self._terms: List[str] = []
+        # Guards _stories, _docs, _postings and _terms
+        self._lock = threading.Lock()
+
+    @classmethod
+    def tokenize(cls, text: Optional[str]) -> List[str]:
+        return cls._TOKEN.findall((text or '').lower())
+
+    def _term_frequencies(self, story: Dict) -> Counter:
+        frequencies = Counter()
+        for term in self.tokenize(story.get('name')):
+            frequencies[term] += self.name_weight
+        frequencies.update(self.tokenize(story.get('description')))
+        for label in story.get('labels') or []:
+            frequencies.update(self.tokenize(label.get('name')))
+        return frequencies
+
+    def sync(self, stories: Iterable[Dict]) -> int:
+        """
+        :return: number of stories that were (re)indexed
+        """
+        with self._lock:
+            indexed = 0
+            for story in stories:
+                story_id = story['id']
+                self._stories[story_id] = story
+                previous = self._docs.get(story_id)
+                if previous is not None and previous[0] == story.get('updated_at'):
+                    continue
+                if previous is not None:
+                    for term in previous[1]:
+                        del self._postings[term][story_id]
+                        if not self._postings[term]:
+                            del self._postings[term]
+                            del self._terms[bisect.bisect_left(self._terms, term)]
+                frequencies = self._term_frequencies(story)
+                for term, count in frequencies.items():
+                    if term not in self._postings:
+                        bisect.insort(self._terms, term)
+                    self._postings[term][story_id] = count
+                self._docs[story_id] = (story.get('updated_at'), frequencies)
+                indexed += 1
+            return indexed
+
+    def _expand(self, term: str) -> List[str]:
+        if not term.endswith('*'):
+            return [term] if term in self._postings else []
+        prefix = term[:-1]
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\uffff')
+        return self._terms[start:end]
+
+    def _match(self, term: str) -> Dict[int, float]:
+        # story id -> TF-IDF score of the term, or of all terms with the prefix
+        scores: Dict[int, float] = defaultdict(float)
+        for expanded in self._expand(term):
+            postings = self._postings[expanded]
+            idf = math.log(1 + len(self._docs) / len(postings))
+            for story_id, count in postings.items():
+                scores[story_id] += count * idf
+        return scores
+
+    def search(self, query: str, limit: int = 50) -> List[Dict]:
+        """
+        :return: matching stories, best first
+        """
+        with self._lock:
+            scores: Dict[int, float] = {}
+            for group in re.split(r'\s+OR\s+', query.strip()):
+                words = group.lower().split()
+                required = [t for w in words if not w.startswith('-') for t in self._query_terms(w)]
+                excluded = [t for w in words if w.startswith('-') for t in self._query_terms(w[1:])]
+                if not required:
+                    continue
+                matches = [self._match(t) for t in required]
+                story_ids = set.intersection(*(set(m) for m in matches))
+                for t in excluded:
+                    for expanded in self._expand(t):
+                        story_ids -= self._postings[expanded].keys()
+                for story_id in story_ids:
+                    scores[story_id] = max(scores.get(story_id, 0), sum(m[story_id] for m in matches))
+            ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+            return [self._stories[story_id] for story_id in ranked]
+
+    def _query_terms(self, word: str) -> List[str]:
+        # Query words go through the same tokenizer as the stories, keeping a trailing * for prefixes
+        terms = self.tokenize(word)
+        if word.endswith('*') and terms:
+            terms[-1] += '*'
+        return terms
@@ -0,0 +1,60 @@
+import re
+import numpy as np
+from collections import defaultdict
+from typing import List, Dict
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+
+class ExtractiveSummarizer:
+    """
+    In-process member summary, for when the LLM is not configured or too slow. Stories are grouped by
+    workflow state into templated sentences, followed by the description sentences that rank highest
+    by TF-IDF weight across the member's work.
+    """
+
+    def __init__(self, max_titles_per_state: int = 3, max_detail_sentences: int = 3):
+        self.max_titles_per_state = max_titles_per_state
+        self.max_detail_sentences = max_detail_sentences
+
+    def summarize(self, team_member_name: str, work: List[Dict[str, str]]) -> str:
+        """
+        :param work: one dict per story with its Title, State and sanitized Details
+        """
+        if not work:
+            return f"{team_member_name}'s work is not being tracked in this sprint."
+
+        titles_by_state: Dict[str, List[str]] = defaultdict(list)
+        for item in work:
+            titles_by_state[item['State']].append(item['Title'])
+        counts = ', '.join(f"{len(titles)} {state}" for state, titles in titles_by_state.items())
+        sentences = [f"{team_member_name} has {len(work)} stories this sprint: {counts}."]
+        for state, titles in titles_by_state.items():
+            shown = '; '.join(titles[:self.max_titles_per_state])
+            more = len(titles) - self.max_titles_per_state
+            sentences.append(f"{state}: {shown}" + (f" and {more} more." if more > 0 else "."))
+
+        details = self.rank_sentences([item['Details'] for item in work])
+        if details:
+            sentences.append("Highlights: " + ' '.join(details))
+        return '\n\n'.join(sentences)
+
+    def rank_sentences(self, texts: List[str]) -> List[str]:
+        """
+        :return: the highest ranked sentences of texts, in their original order
+        """
+        candidates = [s.strip() for text in texts for s in _SENTENCE_SPLIT.split(text or '')]
+        # Stories often share boilerplate, rank each distinct sentence once
+        candidates = list(dict.fromkeys(s for s in candidates if len(s.split()) >= 4))
+        if not candidates:
+            return []
+        try:
+            weights = TfidfVectorizer(stop_words='english', sublinear_tf=True).fit_transform(candidates)
+        except ValueError:
+            # Nothing but stop words
+            return []
+        # Mean weight rather than sum, so long run-on sentences do not win by length alone
+        scores = np.asarray(weights.sum(axis=1)).ravel() / np.maximum(weights.getnnz(axis=1), 1)
+        top = sorted(np.argsort(-scores)[:self.max_detail_sentences])
+        return [candidates[i] if candidates[i][-1] in '.!?' else candidates[i] + '.' for i in top]
@@ -0,0 +1,87 @@
+import os
+import json
+from typing import List, Dict, Optional
+
+
+class TenantConfig:
+    """
+    Everything that ties the dashboard to one Shortcut workspace: the token, the special milestones and
+    epics the dashboard is built around, and the router's connection / rate-limit budget.
+    Defaults match the original single-workspace setup.
+    """
+
+    def __init__(self,
+                 name: str = 'default',
+                 token_env: str = 'SHORTCUT_API_TOKEN',
+                 no_projects_milestone_id: int = 3073,
+                 general_milestone_id: int = 3077,
+                 general_bugs_epic_id: int = 3078,
+                 general_improvements_epic_id: int = 3079,
+                 priority_field_id: str = '62f6c112-35ed-4b29-9e07-dd16975ba823',
+                 custom_fields: Optional[Dict[str, str]] = None,
+                 state_groups: Optional[Dict[str, List[str]]] = None,
+                 requests_per_minute: int = 200,
+                 pool_maxsize: int = 10,
+                 base_url: str = 'https://api.app.shortcut.com/api',
+                 refresh_seconds: int = 300,
+                 change_retention_days: int = 7):
+        self.name = name
+        self.token_env = token_env
+        # No Projects Assigned
+        self.no_projects_milestone_id = no_projects_milestone_id
+        # General Bugs & Improvements
+        self.general_milestone_id = general_milestone_id
+        self.general_bugs_epic_id = general_bugs_epic_id
+        self.general_improvements_epic_id = general_improvements_epic_id
+        self.priority_field_id = priority_field_id
+        # Story table column name -> custom field id, extracted from every story as it is loaded
+        self.custom_fields = {'Priority': priority_field_id, **(custom_fields or {})}
+        # Workflow state names per state group (review, triage, unneeded, ready), so that filters
+        # keep working when a workflow names its states differently
+        self.state_groups = {
+            'review': ['In Review'],
+            'triage': ['Triage'],
+            'unneeded': ['Unneeded'],
+            'ready': ['Ready for Development'],
+            **(state_groups or {}),
+        }
+        self.requests_per_minute = requests_per_minute
+        self.pool_maxsize = pool_maxsize
+        # Shortcut API root, overridable to point at a fake server in load tests
+        self.base_url = base_url
+        # How long loaded milestones, epics and stories are reused before the router reloads them
+        self.refresh_seconds = refresh_seconds
+        # How far back the change feed goes
+        self.change_retention_days = change_retention_days
+
+    @property
+    def special_milestone_ids(self):
+        return {self.no_projects_milestone_id, self.general_milestone_id}
+
+    @property
+    def token(self) -> Optional[str]:
+        return os.getenv(self.token_env)
+
+
+class TenantRegistry:
+    """
+    Teams served by this deployment, loaded from the JSON file named by SPRINT_DB_TENANTS: a list of
+    objects with TenantConfig's keyword arguments. Without that file, a single default tenant is used.
+    """
+
+    def __init__(self, tenants: List[TenantConfig]):
+        self._tenants: Dict[str, TenantConfig] = {t.name: t for t in tenants}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'TenantRegistry':
+        path = path or os.getenv('SPRINT_DB_TENANTS')
+        if not path:
+            return cls([TenantConfig()])
+        with open(path) as f:
+            return cls([TenantConfig(**t) for t in json.load(f)])
+
+    def get(self, name: str) -> TenantConfig:
+        return self._tenants[name]
+
+    def names(self) -> List[str]:
+        return list(self._tenants.keys())
@@ -1,17 +1,104 @@
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List
-from api_router import ApiRouter
+from typing import Dict, List, Iterator, Optional
+from api_router import ApiRouter, STATE_REVIEW, STATE_TRIAGE, STATE_UNNEEDED, STATE_READY
+from alerts import AlertEngine
+from burndown import BurndownEngine
+from flow_metrics import FlowMetrics
+from forecast import MilestoneForecaster
+from story_index import OwnerIndex, SimilarityIndex, SearchIndex
+from summarizer import ExtractiveSummarizer
 import os
 import re
+import logging
+import threading
 import openai
 
+logger = logging.getLogger(__name__)
+
 
 class Utils:
 
     def __init__(self, r: ApiRouter):
         self.r = r
-        self._priority_field_id = '62f6c112-35ed-4b29-9e07-dd16975ba823'
+        # Configured custom fields that get their own table column, besides Priority
+        self._extra_custom_fields = [name for name in r.tenant.custom_fields if name != 'Priority']
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
+        # None for OPENAI_BASE_URL or api.openai.com
+        self.openai_base_url: Optional[str] = None
+        self._openai_client: Optional[openai.OpenAI] = None
+        # Member summary mode: 'llm', 'local', or 'auto' (the LLM, falling back to the local summary
+        # when there is no API key or the API errors / times out)
+        self.summary_mode = os.getenv('SPRINT_DB_SUMMARY_MODE', 'auto')
+        self.llm_timeout = float(os.getenv('SPRINT_DB_LLM_TIMEOUT', '15'))
+        self.local_summarizer = ExtractiveSummarizer()
+        # Owner indexes by sprint data version, so reruns over unchanged stories reuse them
+        self._owner_indexes: Dict[int, OwnerIndex] = {}
+        self._max_owner_indexes = 8
+        # Guards _owner_indexes, _llm_summaries and _openai_client
+        self._cache_lock = threading.Lock()
+        self.burndown = BurndownEngine()
+        self.forecaster = MilestoneForecaster()
+        self.flow = FlowMetrics(r)
+        self.alerts = AlertEngine(r.tenant.name)
+        # TF-IDF over every loaded story, kept in sync as stories are loaded
+        self.similarity = SimilarityIndex()
+        # Inverted index over every loaded story, for the story search box
+        self.search = SearchIndex()
+        # Router data generation that the dashboard's once-per-refresh checks last ran for
+        self._checked_generation: Optional[int] = None
+        self._checks_lock = threading.Lock()
+        # Finished member summaries, keyed by their prompt
+        self._llm_summaries: Dict[int, str] = {}
+        self._max_llm_summaries = 64
+
+    @staticmethod
+    def get_data_version(groups: Dict[str, List]) -> int:
+        return hash(tuple((group, s['id'], s.get('updated_at'), s.get('workflow_state_id'), tuple(s['owner_ids']))
+                          for group, stories in groups.items() for s in stories))
+
+    def get_owner_index(self, groups: Dict[str, List]) -> OwnerIndex:
+        version = self.get_data_version(groups)
+        with self._cache_lock:
+            owner_index = self._owner_indexes.get(version)
+        if owner_index is None:
+            owner_index = OwnerIndex(self.r, groups)
+            with self._cache_lock:
+                if len(self._owner_indexes) >= self._max_owner_indexes:
+                    self._owner_indexes.pop(next(iter(self._owner_indexes)))
+                self._owner_indexes[version] = owner_index
+        return owner_index
+
+    def claim_checks(self, generation: int) -> bool:
+        """
+        :return: True for exactly one caller per router data generation, which should then run the checks
+        """
+        with self._checks_lock:
+            if self._checked_generation == generation:
+                return False
+            self._checked_generation = generation
+            return True
+
+    def get_stories_as_of(self, stories: List, at: datetime) -> List:
+        """
+        Stories as they were at `at`: only completed if their completed_at is before it, and in the workflow
+        state they had then if the change log saw them move since. Changed stories are copies.
+        """
+        states = self.r.change_log.get_states_at(at.timestamp())
+        stories_as_of = []
+        for story in stories:
+            completed_at = story.get('completed_at')
+            completed = (story.get('completed') is True and completed_at is not None and
+                         datetime.fromisoformat(completed_at.replace('Z', '+00:00')) < at)
+            workflow_state_id = states.get(story['id'], story['workflow_state_id'])
+            if completed == story.get('completed') and workflow_state_id == story['workflow_state_id']:
+                stories_as_of.append(story)
+                continue
+            # Without the cached state class, so that it is looked up again for the old state
+            story = {k: v for k, v in story.items() if k != 'state_class'}
+            story['completed'] = completed
+            story['workflow_state_id'] = workflow_state_id
+            stories_as_of.append(story)
+        return stories_as_of
 
     def filter_all_but_unneeded_and_completed(self, story_list: List) -> List:
         return [e for e in story_list if e.get("unneeded", "") is not True and e.get("completed", "") is not True]
@@ -23,11 +110,11 @@ class Utils:
         :return:
         """
         return [e for e in story_list if
-                e.get("unneeded", "") is not True and e.get("completed", "") is not True and self.r.get_workflow(
-                    e['workflow_state_id']) != 'In Review']
+                e.get("unneeded", "") is not True and e.get("completed", "") is not True and
+                not self.r.get_state_class(e) & STATE_REVIEW]
 
     def filter_all_but_unneeded(self, story_list: List):
-        return [story for story in story_list if self.r.get_workflow(story.get("workflow_state_id", "")) != "Unneeded"]
+        return [story for story in story_list if not self.r.get_state_class(story) & STATE_UNNEEDED]
 
     def filter_completed(self, story_list: List) -> List:
         """
@@ -38,19 +125,14 @@ class Utils:
         return [e for e in story_list if e.get("completed", "") is True]
 
     def filter_in_review_and_ready_for_development(self, story_list: List) -> List:
-        return [
-            e for e in story_list if
-            self.r.get_workflow(e['workflow_state_id']) == 'Ready for Development' or
-            self.r.get_workflow(e['workflow_state_id']) == 'In Review' or
-            self.r.get_workflow(e['workflow_state_id']) == 'Triage'
-        ]
+        return [e for e in story_list if self.r.get_state_class(e) & (STATE_READY | STATE_REVIEW | STATE_TRIAGE)]
 
     def filter_triage(self, story_list: List) -> List:
-        return [e for e in story_list if self.r.get_workflow(e['workflow_state_id']) == 'Triage']
+        return [e for e in story_list if self.r.get_state_class(e) & STATE_TRIAGE]
 
     def filter_completed_and_in_review(self, story_list: List) -> List:
         return [e for e in story_list if
-                e.get('completed', '') is True or self.r.get_workflow(e['workflow_state_id']) == 'In Review']
+                e.get('completed', '') is True or self.r.get_state_class(e) & STATE_REVIEW]
 
     def filter_bugs(self, stories: List) -> List:
         return [s for s in stories if s.get('story_type', '') == 'bug']
@@ -61,12 +143,20 @@ class Utils:
     def filter_non_archived(self, stories: List) -> List:
         return [s for s in stories if s.get('archived', False) is not True]
 
-    def filter_stories_by_epic(self, stories: List, epic_name: str) -> Dict:
+    @staticmethod
+    def group_stories_by_epic(stories: List) -> Dict[int, List]:
+        stories_by_epic: Dict[int, List] = {}
+        for story in stories:
+            stories_by_epic.setdefault(story["epic_id"], []).append(story)
+        return stories_by_epic
+
+    def filter_stories_by_epic(self, stories_by_epic: Dict[int, List], epic_ids: List[int]) -> Dict:
         fields = ["ID", "Story", "Type", "Milestone", "Priority", "State", "Created", "Requested By", "Owner"]
         fields_lists = [[] for _ in fields]
+        custom_field_lists = {name: [] for name in self._extra_custom_fields}
 
-        for story in stories:
-            if epic_name == self.r.get_epic_name(story["epic_id"]).strip():
+        for epic_id in epic_ids:
+            for story in stories_by_epic.get(epic_id, []):
                 self._populate_lists_for_story_dataframe(
                     id_list=fields_lists[fields.index("ID")],
                     creation_date_list=fields_lists[fields.index("Created")],
@@ -78,24 +168,55 @@ class Utils:
                     story_type_list=fields_lists[fields.index("Type")],
                     requester_names=fields_lists[fields.index("Requested By")],
                     assignee_names=fields_lists[fields.index("Owner")],
+                    custom_field_lists=custom_field_lists,
                 )
 
-        return dict(zip(fields, fields_lists))
+        return {**dict(zip(fields, fields_lists)), **custom_field_lists}
 
-    def filter_stories_by_member(self, stories: List, member_name: str) -> Dict:
-        filtered_stories = [story for story in stories if
-                            member_name in [self.r.get_owner_name(owner).replace("\\", "") for owner in
-                                            story["owner_ids"] if self.r.get_owner_name(owner) is not None]]
+    def filter_stories_by_member(self, owner_index: OwnerIndex, member_name: str) -> Dict:
+        filtered_stories = owner_index.get_stories_for_member(member_name)
         data = {key: [] for key in ["ID", "Story", "Type", "Milestone", "Priority", "State", "Created", "Requested By"]}
+        custom_field_lists = {name: [] for name in self._extra_custom_fields}
         for story in filtered_stories:
             self._populate_lists_for_story_dataframe(data["ID"], data["Created"], data["Milestone"], data["Priority"],
                                                      data["State"], story, data["Story"], data["Type"],
-                                                     data["Requested By"])
+                                                     data["Requested By"], custom_field_lists=custom_field_lists)
+        return {**data, **custom_field_lists}
+
+    def get_story_table_data(self, stories: List) -> Dict:
+        data = {key: [] for key in ["ID", "Story", "Type", "Milestone", "Priority", "State", "Created", "Requested By",
+                                    "Owner"]}
+        custom_field_lists = {name: [] for name in self._extra_custom_fields}
+        for story in stories:
+            self._populate_lists_for_story_dataframe(data["ID"], data["Created"], data["Milestone"], data["Priority"],
+                                                     data["State"], story, data["Story"], data["Type"],
+                                                     data["Requested By"], data["Owner"], custom_field_lists)
+        return {**data, **custom_field_lists}
+
+    def get_possible_duplicates_table(self, stories: List, k: int = 3, min_score: float = 0.5) -> Dict:
+        """
+        Stories with their most similar loaded stories, for stories that have any above min_score.
+        Duplicates are rendered as links, with their cosine similarity.
+        """
+        loaded_stories = {s['id']: s for s in self.r.get_loaded_stories()}
+        data = {"ID": [], "Story": [], "State": [], "Possible Duplicates": []}
+        for story in stories:
+            similar = [(loaded_stories[sid], score) for sid, score in
+                       self.similarity.get_similar_stories(story['id'], k=k, min_score=min_score)
+                       if sid in loaded_stories]
+            if not similar:
+                continue
+            data["ID"].append(f"{story['id']}")
+            data["Story"].append(f"{story['name']}###{story['app_url']}")
+            data["State"].append(self.r.get_workflow(story["workflow_state_id"]))
+            data["Possible Duplicates"].append('<br>'.join(
+                f"<a href={s['app_url']} target='_blank'>{s['name']}</a> ({score:.2f})" for s, score in similar))
         return data
 
     def _populate_lists_for_story_dataframe(self, id_list, creation_date_list, milestone_name_list, priority_list,
                                             state_list,
-                                            story, story_list, story_type_list, requester_names, assignee_names=None):
+                                            story, story_list, story_type_list, requester_names, assignee_names=None,
+                                            custom_field_lists=None):
         if assignee_names is None:
             assignee_names = list()
         milestone_name = ""
@@ -127,13 +248,12 @@ class Utils:
         else:
             assignee_names.append(assignee_name)
 
-        custom_fields = story["custom_fields"]
-        for cf in custom_fields:
-            if cf["field_id"] != self._priority_field_id:
-                continue
-            else:
-                priority_value = str(cf["value"]).upper()
+        custom_field_columns = self.r.get_custom_field_columns(story)
+        if custom_field_columns.get('Priority') is not None:
+            priority_value = str(custom_field_columns['Priority']).upper()
         priority_list.append(priority_value)
+        for name, values in (custom_field_lists or {}).items():
+            values.append(custom_field_columns.get(name))
         state_list.append(self.r.get_workflow(story["workflow_state_id"]))
 
     def filter_recent_sprints(self, iterations: List) -> List:
@@ -196,25 +316,124 @@ class Utils:
                 active_epics_list.append(e)
         return active_epics_list
 
-    def get_llm_summary_for_stories(self, stories, team_member_name):
-        work_summary = ""
-        for story_id, story_title in zip(stories['ID'], stories['Story']):
-            # Get the full content of the story from the ID
-            story = self.r.get_story_by_id(story_id)
-            story_title = "Summary: " + story_title.split("###")[0]
-            work_summary += story_title + "."
-            story['description'] = re.sub(r'\{.*?\}', '', story['description'])
-            story['description'] = re.sub(
+    def use_llm_summary(self, mode: Optional[str] = None) -> bool:
+        mode = mode or self.summary_mode
+        return mode == 'llm' or (mode == 'auto' and bool(self.openai_api_key))
+
+    def get_local_summary_for_stories(self, stories, team_member_name) -> str:
+        return self.local_summarizer.summarize(team_member_name, self._get_member_work(stories))
+
+    def get_llm_summary_for_stories(self, stories, team_member_name, mode: Optional[str] = None):
+        if not self.use_llm_summary(mode):
+            return self.get_local_summary_for_stories(stories, team_member_name)
+        messages = self._get_llm_summary_messages(stories, team_member_name)
+        cache_key = self._get_llm_summary_cache_key(messages)
+        summary = self._get_cached_llm_summary(cache_key)
+        if summary is not None:
+            return summary
+        try:
+            chat = self._get_openai_client().chat.completions.create(model="gpt-3.5-turbo", messages=messages)
+        except Exception as e:
+            if (mode or self.summary_mode) != 'auto':
+                raise
+            logger.warning("LLM summary failed, using the local summary: %s", e)
+            return self.get_local_summary_for_stories(stories, team_member_name)
+        summary = chat.choices[0].message.content
+        self._cache_llm_summary(cache_key, summary)
+        return summary
+
+    def stream_llm_summary_for_stories(self, stories, team_member_name, mode: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream the member summary as it is generated. Closing the generator early (e.g. Streamlit rerunning
+        the script because the selectbox changed) stops reading the response. Only a summary that was
+        streamed to the end is cached, later calls yield it in one piece.
+        In 'auto' mode, the local summary is yielded instead if the LLM fails before its first chunk.
+        """
+        if not self.use_llm_summary(mode):
+            yield self.get_local_summary_for_stories(stories, team_member_name)
+            return
+        messages = self._get_llm_summary_messages(stories, team_member_name)
+        cache_key = self._get_llm_summary_cache_key(messages)
+        summary = self._get_cached_llm_summary(cache_key)
+        if summary is not None:
+            yield summary
+            return
+        chunks = []
+        response = None
+        try:
+            response = self._get_openai_client().chat.completions.create(
+                model="gpt-3.5-turbo", messages=messages, stream=True
+            )
+            for chunk in response:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    chunks.append(content)
+                    yield content
+        except Exception as e:
+            if chunks or (mode or self.summary_mode) != 'auto':
+                raise
+            logger.warning("LLM summary failed, using the local summary: %s", e)
+            yield self.get_local_summary_for_stories(stories, team_member_name)
+            return
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        self._cache_llm_summary(cache_key, ''.join(chunks))
+
+    def _get_openai_client(self) -> openai.OpenAI:
+        # Created on first use, so that there is no client (and no key needed) for local summaries
+        with self._cache_lock:
+            if self._openai_client is None:
+                self._openai_client = openai.OpenAI(api_key=self.openai_api_key, base_url=self.openai_base_url,
+                                                    timeout=self.llm_timeout)
+            return self._openai_client
+
+    @staticmethod
+    def _get_llm_summary_cache_key(messages: List[Dict]) -> int:
+        return hash(tuple(m['content'] for m in messages))
+
+    def _get_cached_llm_summary(self, cache_key: int) -> Optional[str]:
+        with self._cache_lock:
+            return self._llm_summaries.get(cache_key)
+
+    def _cache_llm_summary(self, cache_key: int, summary: str):
+        with self._cache_lock:
+            if len(self._llm_summaries) >= self._max_llm_summaries:
+                self._llm_summaries.pop(next(iter(self._llm_summaries)))
+            self._llm_summaries[cache_key] = summary
+
+    def _get_member_work(self, stories) -> List[Dict[str, str]]:
+        """
+        :return: Title, State and sanitized Details of each story in a member's story table
+        """
+        work = []
+        # Loaded stories already have their descriptions, only fetch the ones that are not loaded (all at
+        # once: nothing can be summarized, or streamed, before the last of them is in)
+        story_ids = [str(story_id) for story_id in stories['ID']]
+        by_id = {str(s['id']): s for s in self.r.get_loaded_stories()}
+        missing = [story_id for story_id in story_ids if 'description' not in by_id.get(story_id, {})]
+        if missing:
+            by_id.update(zip(missing, self.r.get_stories_by_ids(missing)))
+        for story_title, story in zip(stories['Story'], (by_id[story_id] for story_id in story_ids)):
+            description = re.sub(r'\{.*?\}', '', story['description'])
+            description = re.sub(
                 r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '',
-                story['description'])
-            story['description'] = story['description'].replace('```', '')
-            story['description'] = story['description'].replace('\n', '').replace('\r', '')
-            state = self.r.get_workflow(story['workflow_state_id'])
-            work_summary += f"""{{"State": {state}, "Details": {story['description']}.}}"""
-
-        print("Work")
-        print(work_summary)
-        openai.api_key = self.openai_api_key
+                description)
+            description = description.replace('```', '')
+            description = description.replace('\n', '').replace('\r', '')
+            work.append({
+                'Title': story_title.split("###")[0],
+                'State': self.r.get_workflow(story['workflow_state_id']),
+                'Details': description,
+            })
+        return work
+
+    def _get_llm_summary_messages(self, stories, team_member_name) -> List[Dict]:
+        work_summary = ""
+        for item in self._get_member_work(stories):
+            work_summary += "Summary: " + item['Title'] + "."
+            work_summary += f"""{{"State": {item['State']}, "Details": {item['Details']}.}}"""
+
         prompt = f"""
             Galileo is a Machine Learning evaluation tools company, focused on 
             building a platform to curate better data for NLP, Computer Vision and LLM (the product is called 
@@ -252,8 +471,4 @@ class Utils:
         messages = [
             {"role": "system", "content": prompt},
         ]
-        chat = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo", messages=messages
-        )
-        summary = chat.choices[0].message.content
-        return summary
+        return messages